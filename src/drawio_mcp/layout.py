@@ -11,6 +11,7 @@ These are algorithmic layouts implementing professional graph drawing techniques
 from __future__ import annotations
 
 import math
+from collections import defaultdict
 from dataclasses import dataclass
 from typing import Optional
 
@@ -390,7 +391,6 @@ def distribute_ports_for_batch(
 
     # Step 2: group edges by (node_id, side) to find siblings
     # For exits: group by (source_id, exit_side)
-    from collections import defaultdict
     exit_groups: dict[tuple[str, str], list[int]] = defaultdict(list)
     entry_groups: dict[tuple[str, str], list[int]] = defaultdict(list)
 
@@ -399,11 +399,16 @@ def distribute_ports_for_batch(
         exit_groups[(src_id, exit_side)].append(i)
         entry_groups[(tgt_id, entry_side)].append(i)
 
-    # Step 3: sort siblings within each group by target/source position
-    # so ports are ordered spatially (left-to-right, top-to-bottom)
+    # Step 3+4: per group, sort siblings by the peer's position along the
+    # perpendicular axis (left-to-right, top-to-bottom) and assign the
+    # distributed port in the same pass.  Enumerating the sorted group
+    # hands each edge its own rank directly, instead of re-searching the
+    # sibling list per edge (which is quadratic for fan-in/fan-out hubs).
+    exit_ports: list[tuple[float, float]] = [(0.5, 0.5)] * len(connections)
+    entry_ports: list[tuple[float, float]] = [(0.5, 0.5)] * len(connections)
+
     for (node_id, side), indices in exit_groups.items():
         if len(indices) > 1:
-            # Sort by target position along the perpendicular axis.
             # Capture `side` via default arg to avoid late-binding.
             def _sort_key_exit(idx: int, _side: str = side) -> float:
                 tgt_id = connections[idx][1]
@@ -415,6 +420,9 @@ def distribute_ports_for_batch(
                 else:
                     return tgt_b.cy  # sort top-to-bottom
             indices.sort(key=_sort_key_exit)
+        count = len(indices)
+        for rank, idx in enumerate(indices):
+            exit_ports[idx] = _distribute_ports_on_side(side, count, rank)
 
     for (node_id, side), indices in entry_groups.items():
         if len(indices) > 1:
@@ -428,31 +436,11 @@ def distribute_ports_for_batch(
                 else:
                     return src_b.cy  # sort top-to-bottom
             indices.sort(key=_sort_key_entry)
+        count = len(indices)
+        for rank, idx in enumerate(indices):
+            entry_ports[idx] = _distribute_ports_on_side(side, count, rank)
 
-    # Step 4: assign distributed ports
-    results: list[tuple[tuple[float, float], tuple[float, float]]] = [
-        ((0.5, 0.5), (0.5, 0.5)) for _ in connections
-    ]
-
-    for i in range(len(connections)):
-        src_id, tgt_id = connections[i]
-        exit_side, entry_side = edge_sides[i]
-
-        # Find this edge's position among its exit siblings
-        exit_key = (src_id, exit_side)
-        exit_siblings = exit_groups[exit_key]
-        exit_idx = exit_siblings.index(i)
-        exit_port = _distribute_ports_on_side(exit_side, len(exit_siblings), exit_idx)
-
-        # Find this edge's position among its entry siblings
-        entry_key = (tgt_id, entry_side)
-        entry_siblings = entry_groups[entry_key]
-        entry_idx = entry_siblings.index(i)
-        entry_port = _distribute_ports_on_side(entry_side, len(entry_siblings), entry_idx)
-
-        results[i] = (exit_port, entry_port)
-
-    return results
+    return list(zip(exit_ports, entry_ports))
 
 
 # ---------------------------------------------------------------------------
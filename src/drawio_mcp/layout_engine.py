@@ -489,6 +489,7 @@ def _find_virtual_chain(
 def route_edges_around_obstacles(
     diagram: Diagram,
     margin: float = 15,
+    bounds: dict[str, CellBounds] | None = None,
 ) -> int:
     """Reroute ALL edges in a diagram so they don't cross any shape bounding box.
 
@@ -500,11 +501,14 @@ def route_edges_around_obstacles(
     Args:
         diagram: The diagram whose edges will be rerouted.
         margin: Clearance around shapes (pixels).
+        bounds: Precomputed absolute vertex bounds; computed when omitted.
+            Routing never moves vertices, so a caller's snapshot stays valid.
 
     Returns:
         Number of edges rerouted.
     """
-    bounds = get_all_vertex_bounds(diagram)
+    if bounds is None:
+        bounds = get_all_vertex_bounds(diagram)
     if not bounds:
         return 0
 
@@ -1044,6 +1048,43 @@ def _relayout_grid(
 # Overlap Detection (for diagrams)
 # ---------------------------------------------------------------------------
 
+def _candidate_pairs(
+    bounds: dict[str, CellBounds],
+    margin: float,
+) -> list[tuple[str, str]]:
+    """Candidate overlap pairs from a uniform spatial hash.
+
+    Buckets every box (inflated by ``margin``) into a grid sized to the
+    median shape extent; only boxes sharing a bucket can intersect, which
+    turns the all-pairs check into a near-linear sweep for spread-out
+    diagrams.  Pairs come back in the same order the nested i<j loop over
+    ``bounds`` insertion order would visit them.
+    """
+    ids = list(bounds.keys())
+    if len(ids) < 2:
+        return []
+
+    sizes = sorted(max(b.width, b.height) for b in bounds.values())
+    cell = max(sizes[len(sizes) // 2] + 2 * margin, 1.0)
+
+    grid: dict[tuple[int, int], list[int]] = {}
+    pairs: set[tuple[int, int]] = set()
+    for idx, cid in enumerate(ids):
+        b = bounds[cid]
+        x0 = int((b.x - margin) // cell)
+        x1 = int((b.right + margin) // cell)
+        y0 = int((b.y - margin) // cell)
+        y1 = int((b.bottom + margin) // cell)
+        for gx in range(x0, x1 + 1):
+            for gy in range(y0, y1 + 1):
+                bucket = grid.setdefault((gx, gy), [])
+                for other in bucket:
+                    pairs.add((other, idx))
+                bucket.append(idx)
+
+    return [(ids[i], ids[j]) for i, j in sorted(pairs)]
+
+
 def find_overlapping_cells(diagram: Diagram, margin: float = 5) -> list[tuple[str, str]]:
     """Find all pairs of overlapping vertices in a diagram.
 
@@ -1057,13 +1098,9 @@ def find_overlapping_cells(diagram: Diagram, margin: float = 5) -> list[tuple[st
     bounds = get_all_vertex_bounds(diagram)
     overlaps: list[tuple[str, str]] = []
 
-    ids = list(bounds.keys())
-    for i in range(len(ids)):
-        for j in range(i + 1, len(ids)):
-            a = bounds[ids[i]]
-            b = bounds[ids[j]]
-            if a.intersects(b, margin):
-                overlaps.append((ids[i], ids[j]))
+    for a_id, b_id in _candidate_pairs(bounds, margin):
+        if bounds[a_id].intersects(bounds[b_id], margin):
+            overlaps.append((a_id, b_id))
 
     return overlaps
 
@@ -1086,75 +1123,68 @@ def resolve_overlaps(
         Number of shapes moved.
     """
     moved_count = 0
+    by_id = {cell.id: cell for cell in diagram.cells}
 
     for iteration in range(max_iterations):
         bounds = get_all_vertex_bounds(diagram)
         any_overlap = False
 
-        ids = list(bounds.keys())
-        for i in range(len(ids)):
-            for j in range(i + 1, len(ids)):
-                a_id, b_id = ids[i], ids[j]
-                a_bounds = bounds[a_id]
-                b_bounds = bounds[b_id]
-
-                if not a_bounds.intersects(b_bounds, margin):
-                    continue
+        for a_id, b_id in _candidate_pairs(bounds, margin):
+            a_bounds = bounds[a_id]
+            b_bounds = bounds[b_id]
 
-                any_overlap = True
-                # Find the cells
-                a_cell = b_cell = None
-                for cell in diagram.cells:
-                    if cell.id == a_id:
-                        a_cell = cell
-                    elif cell.id == b_id:
-                        b_cell = cell
-
-                if not (a_cell and b_cell and a_cell.geometry and b_cell.geometry):
-                    continue
+            if not a_bounds.intersects(b_bounds, margin):
+                continue
 
-                # Compute push direction and magnitude
-                dx = b_bounds.cx - a_bounds.cx
-                dy = b_bounds.cy - a_bounds.cy
+            any_overlap = True
+            a_cell = by_id.get(a_id)
+            b_cell = by_id.get(b_id)
 
-                # How much overlap on each axis
-                overlap_x = (a_bounds.width / 2 + b_bounds.width / 2 + margin) - abs(dx)
-                overlap_y = (a_bounds.height / 2 + b_bounds.height / 2 + margin) - abs(dy)
+            if not (a_cell and b_cell and a_cell.geometry and b_cell.geometry):
+                continue
 
-                if overlap_x > 0 and overlap_y > 0:
-                    if overlap_x < overlap_y:
-                        push = overlap_x / 2 + 1
-                        if dx >= 0:
-                            a_cell.geometry.x = snap_to_grid(
-                                a_cell.geometry.x - push, diagram.grid_size
-                            )
-                            b_cell.geometry.x = snap_to_grid(
-                                b_cell.geometry.x + push, diagram.grid_size
-                            )
-                        else:
-                            a_cell.geometry.x = snap_to_grid(
-                                a_cell.geometry.x + push, diagram.grid_size
-                            )
-                            b_cell.geometry.x = snap_to_grid(
-                                b_cell.geometry.x - push, diagram.grid_size
-                            )
+            # Compute push direction and magnitude
+            dx = b_bounds.cx - a_bounds.cx
+            dy = b_bounds.cy - a_bounds.cy
+
+            # How much overlap on each axis
+            overlap_x = (a_bounds.width / 2 + b_bounds.width / 2 + margin) - abs(dx)
+            overlap_y = (a_bounds.height / 2 + b_bounds.height / 2 + margin) - abs(dy)
+
+            if overlap_x > 0 and overlap_y > 0:
+                if overlap_x < overlap_y:
+                    push = overlap_x / 2 + 1
+                    if dx >= 0:
+                        a_cell.geometry.x = snap_to_grid(
+                            a_cell.geometry.x - push, diagram.grid_size
+                        )
+                        b_cell.geometry.x = snap_to_grid(
+                            b_cell.geometry.x + push, diagram.grid_size
+                        )
                     else:
-                        push = overlap_y / 2 + 1
-                        if dy >= 0:
-                            a_cell.geometry.y = snap_to_grid(
-                                a_cell.geometry.y - push, diagram.grid_size
-                            )
-                            b_cell.geometry.y = snap_to_grid(
-                                b_cell.geometry.y + push, diagram.grid_size
-                            )
-                        else:
-                            a_cell.geometry.y = snap_to_grid(
-                                a_cell.geometry.y + push, diagram.grid_size
-                            )
-                            b_cell.geometry.y = snap_to_grid(
-                                b_cell.geometry.y - push, diagram.grid_size
-                            )
-                    moved_count += 1
+                        a_cell.geometry.x = snap_to_grid(
+                            a_cell.geometry.x + push, diagram.grid_size
+                        )
+                        b_cell.geometry.x = snap_to_grid(
+                            b_cell.geometry.x - push, diagram.grid_size
+                        )
+                else:
+                    push = overlap_y / 2 + 1
+                    if dy >= 0:
+                        a_cell.geometry.y = snap_to_grid(
+                            a_cell.geometry.y - push, diagram.grid_size
+                        )
+                        b_cell.geometry.y = snap_to_grid(
+                            b_cell.geometry.y + push, diagram.grid_size
+                        )
+                    else:
+                        a_cell.geometry.y = snap_to_grid(
+                            a_cell.geometry.y + push, diagram.grid_size
+                        )
+                        b_cell.geometry.y = snap_to_grid(
+                            b_cell.geometry.y - push, diagram.grid_size
+                        )
+                moved_count += 1
 
         if not any_overlap:
             break
@@ -1169,6 +1199,7 @@ def resolve_overlaps(
 def position_edge_labels(
     diagram: Diagram,
     margin: float = 8,
+    bounds: dict[str, CellBounds] | None = None,
 ) -> int:
     """Reposition edge labels to avoid overlapping with shapes.
 
@@ -1178,11 +1209,15 @@ def position_edge_labels(
     Args:
         diagram: The diagram to fix.
         margin: Minimum gap between labels and shapes.
+        bounds: Precomputed absolute vertex bounds; computed when omitted.
+            Only label offsets are touched, so a caller's snapshot stays valid.
 
     Returns:
         Number of labels repositioned.
     """
-    bounds = get_all_vertex_bounds(diagram)
+    if bounds is None:
+        bounds = get_all_vertex_bounds(diagram)
+    edges_by_id = {c.id: c for c in diagram.cells if c.edge}
     count = 0
 
     for cell in diagram.cells:
@@ -1191,12 +1226,7 @@ def position_edge_labels(
             continue
         if not cell.geometry.relative:
             continue
-        # Check if parent is an edge
-        parent_cell = None
-        for c in diagram.cells:
-            if c.id == cell.parent and c.edge:
-                parent_cell = c
-                break
+        parent_cell = edges_by_id.get(cell.parent)
         if not parent_cell:
             continue
 
@@ -1430,6 +1460,7 @@ def optimize_edge_paths(
     margin: float = 15,
     straighten_threshold: float = 8,
     nudge_spacing: float = 10,
+    bounds: dict[str, CellBounds] | None = None,
 ) -> int:
     """Optimize all edge paths in a diagram for cleaner, shorter routing.
 
@@ -1452,11 +1483,14 @@ def optimize_edge_paths(
         straighten_threshold: Maximum pixel deviation before two segments
             are considered "nearly collinear" and merged into one.
         nudge_spacing: Minimum pixel gap between parallel overlapping edges.
+        bounds: Precomputed absolute vertex bounds; computed when omitted.
+            Only edge waypoints are touched, so a caller's snapshot stays valid.
 
     Returns:
         Number of edges whose waypoints were modified.
     """
-    bounds = get_all_vertex_bounds(diagram)
+    if bounds is None:
+        bounds = get_all_vertex_bounds(diagram)
     if not bounds:
         return 0
 
@@ -1857,6 +1891,7 @@ def _equalize_rank_sizes(
 def center_diagram_on_page(
     diagram: Diagram,
     margin: float = 50,
+    bounds: dict[str, CellBounds] | None = None,
 ) -> int:
     """Center all diagram content on the page.
 
@@ -1867,11 +1902,14 @@ def center_diagram_on_page(
     Args:
         diagram: The diagram to center.
         margin: Minimum margin from page edges.
+        bounds: Precomputed absolute vertex bounds; computed when omitted.
+            Top-level entries are shifted in place along with the cells.
 
     Returns:
         Number of cells moved.
     """
-    bounds = get_all_vertex_bounds(diagram)
+    if bounds is None:
+        bounds = get_all_vertex_bounds(diagram)
     if not bounds:
         return 0
 
@@ -1913,12 +1951,18 @@ def center_diagram_on_page(
             continue
         if cell.vertex and cell.geometry and not cell.geometry.relative:
             if cell.parent in ("0", "1", ""):
-                cell.geometry.x = snap_to_grid(
+                new_x = snap_to_grid(
                     cell.geometry.x + shift_x, diagram.grid_size,
                 )
-                cell.geometry.y = snap_to_grid(
+                new_y = snap_to_grid(
                     cell.geometry.y + shift_y, diagram.grid_size,
                 )
+                b = bounds.get(cell.id)
+                if b is not None:
+                    b.x += new_x - cell.geometry.x
+                    b.y += new_y - cell.geometry.y
+                cell.geometry.x = new_x
+                cell.geometry.y = new_y
                 moved += 1
 
     return moved
@@ -1927,6 +1971,7 @@ def center_diagram_on_page(
 def ensure_page_margins(
     diagram: Diagram,
     margin: float = 40,
+    bounds: dict[str, CellBounds] | None = None,
 ) -> int:
     """Shift diagram content to ensure nothing is too close to page edges.
 
@@ -1937,11 +1982,14 @@ def ensure_page_margins(
     Args:
         diagram: The diagram to adjust.
         margin: Minimum margin from page edges.
+        bounds: Precomputed absolute vertex bounds; computed when omitted.
+            Top-level entries are shifted in place along with the cells.
 
     Returns:
         Number of cells moved.
     """
-    bounds = get_all_vertex_bounds(diagram)
+    if bounds is None:
+        bounds = get_all_vertex_bounds(diagram)
     if not bounds:
         return 0
 
@@ -1971,20 +2019,39 @@ def ensure_page_margins(
             continue
         if cell.vertex and cell.geometry and not cell.geometry.relative:
             if cell.parent in ("0", "1", ""):
-                cell.geometry.x = snap_to_grid(
+                new_x = snap_to_grid(
                     cell.geometry.x + shift_x, diagram.grid_size,
                 )
-                cell.geometry.y = snap_to_grid(
+                new_y = snap_to_grid(
                     cell.geometry.y + shift_y, diagram.grid_size,
                 )
+                b = bounds.get(cell.id)
+                if b is not None:
+                    b.x += new_x - cell.geometry.x
+                    b.y += new_y - cell.geometry.y
+                cell.geometry.x = new_x
+                cell.geometry.y = new_y
                 moved += 1
 
     return moved
 
 
+def _top_level_cells(
+    diagram: Diagram,
+    bounds: dict[str, CellBounds],
+) -> dict[str, MxCell]:
+    """Index the top-level cells that have an entry in ``bounds``."""
+    return {
+        cell.id: cell
+        for cell in diagram.cells
+        if cell.id in bounds and cell.parent in ("0", "1", "")
+    }
+
+
 def align_rank_baselines(
     diagram: Diagram,
     threshold: float = 20,
+    bounds: dict[str, CellBounds] | None = None,
 ) -> int:
     """Align shapes that are approximately in the same row to share the exact same Y.
 
@@ -1997,19 +2064,18 @@ def align_rank_baselines(
         diagram: The diagram to adjust.
         threshold: Maximum Y-center difference (px) to consider shapes
             as belonging to the same row.
+        bounds: Precomputed absolute vertex bounds; computed when omitted.
+            Top-level entries are moved in place along with the cells.
 
     Returns:
         Number of cells adjusted.
     """
-    bounds = get_all_vertex_bounds(diagram)
+    if bounds is None:
+        bounds = get_all_vertex_bounds(diagram)
     if len(bounds) < 2:
         return 0
 
-    cells: dict[str, MxCell] = {}
-    for cell in diagram.cells:
-        if cell.id in bounds and cell.parent in ("0", "1", ""):
-            cells[cell.id] = cell
-
+    cells = _top_level_cells(diagram, bounds)
     if len(cells) < 2:
         return 0
 
@@ -2045,6 +2111,7 @@ def align_rank_baselines(
             target_y = avg_cy - cell.geometry.height / 2
             target_y = snap_to_grid(target_y, diagram.grid_size)
             if abs(cell.geometry.y - target_y) > 1:
+                bounds[cid].y += target_y - cell.geometry.y
                 cell.geometry.y = target_y
                 adjusted += 1
 
@@ -2054,6 +2121,7 @@ def align_rank_baselines(
 def align_column_centers(
     diagram: Diagram,
     threshold: float = 20,
+    bounds: dict[str, CellBounds] | None = None,
 ) -> int:
     """Align shapes that are approximately in the same column to share the exact same X.
 
@@ -2064,19 +2132,18 @@ def align_column_centers(
         diagram: The diagram to adjust.
         threshold: Maximum X-center difference (px) to consider shapes
             as belonging to the same column.
+        bounds: Precomputed absolute vertex bounds; computed when omitted.
+            Top-level entries are moved in place along with the cells.
 
     Returns:
         Number of cells adjusted.
     """
-    bounds = get_all_vertex_bounds(diagram)
+    if bounds is None:
+        bounds = get_all_vertex_bounds(diagram)
     if len(bounds) < 2:
         return 0
 
-    cells: dict[str, MxCell] = {}
-    for cell in diagram.cells:
-        if cell.id in bounds and cell.parent in ("0", "1", ""):
-            cells[cell.id] = cell
-
+    cells = _top_level_cells(diagram, bounds)
     if len(cells) < 2:
         return 0
 
@@ -2112,6 +2179,7 @@ def align_column_centers(
             target_x = avg_cx - cell.geometry.width / 2
             target_x = snap_to_grid(target_x, diagram.grid_size)
             if abs(cell.geometry.x - target_x) > 1:
+                bounds[cid].x += target_x - cell.geometry.x
                 cell.geometry.x = target_x
                 adjusted += 1
 
@@ -2122,6 +2190,7 @@ def equalize_connected_sizes(
     diagram: Diagram,
     direction: str = "TB",
     threshold: float = 20,
+    bounds: dict[str, CellBounds] | None = None,
 ) -> int:
     """Equalize the sizes of shapes in the same visual row or column.
 
@@ -2133,19 +2202,18 @@ def equalize_connected_sizes(
         diagram: The diagram to adjust.
         direction: Layout direction (TB, BT, LR, RL).
         threshold: Proximity threshold for grouping.
+        bounds: Precomputed absolute vertex bounds; computed when omitted.
+            Top-level entries are resized in place along with the cells.
 
     Returns:
         Number of cells adjusted.
     """
-    bounds = get_all_vertex_bounds(diagram)
+    if bounds is None:
+        bounds = get_all_vertex_bounds(diagram)
     if len(bounds) < 2:
         return 0
 
-    cells: dict[str, MxCell] = {}
-    for cell in diagram.cells:
-        if cell.id in bounds and cell.parent in ("0", "1", ""):
-            cells[cell.id] = cell
-
+    cells = _top_level_cells(diagram, bounds)
     if len(cells) < 2:
         return 0
 
@@ -2167,6 +2235,7 @@ def equalize_connected_sizes(
                 cell = cells.get(cid)
                 if cell and cell.geometry and cell.geometry.height < max_h:
                     cell.geometry.height = max_h
+                    bounds[cid].height = max_h
                     adjusted += 1
     else:
         # Group into columns, equalize widths
@@ -2184,6 +2253,7 @@ def equalize_connected_sizes(
                 cell = cells.get(cid)
                 if cell and cell.geometry and cell.geometry.width < max_w:
                     cell.geometry.width = max_w
+                    bounds[cid].width = max_w
                     adjusted += 1
 
     return adjusted
@@ -12,6 +12,7 @@ import uuid
 import xml.etree.ElementTree as ET
 from dataclasses import dataclass, field
 from enum import Enum
+from functools import lru_cache
 from typing import Optional
 
 
@@ -55,20 +56,30 @@ class EdgeStyle(Enum):
 # Data classes
 # ---------------------------------------------------------------------------
 
-@dataclass
+@lru_cache(maxsize=8192)
+def _point_attrib(x: float, y: float, role: Optional[str]) -> dict[str, str]:
+    """Cached mxPoint attribute dict — grid-snapped coordinates repeat heavily.
+
+    ET.Element copies the attrib dict on construction, so sharing the cached
+    dict across calls is safe.
+    """
+    attrib = {"x": str(x), "y": str(y)}
+    if role:
+        attrib["as"] = role
+    return attrib
+
+
+@dataclass(slots=True)
 class Point:
     """A 2-D coordinate."""
     x: float
     y: float
 
     def to_element(self, role: Optional[str] = None) -> ET.Element:
-        el = ET.Element("mxPoint", attrib={"x": str(self.x), "y": str(self.y)})
-        if role:
-            el.set("as", role)
-        return el
+        return ET.Element("mxPoint", attrib=_point_attrib(self.x, self.y, role))
 
 
-@dataclass
+@dataclass(slots=True)
 class Geometry:
     """Geometry of an mxCell (position + size for vertices, relative for edges)."""
     x: float = 0
@@ -115,7 +126,7 @@ class Geometry:
         return el
 
 
-@dataclass
+@dataclass(slots=True)
 class MxCell:
     """A single mxCell element — vertex, edge, or structural cell."""
     id: str
@@ -153,37 +164,67 @@ class MxCell:
         )
 
     def to_element(self) -> ET.Element:
+        # Dispatch on cell kind so each path only checks the attributes
+        # that can actually occur for that kind of cell.
+        if self.edge:
+            el = self._emit_edge()
+        elif self.vertex:
+            el = self._emit_vertex()
+        else:
+            el = self._emit_structural()
+        if self.geometry:
+            el.append(self.geometry.to_element())
+
+        # Wrap in <object> if metadata fields are set
+        if self._has_object_wrapper:
+            return self._wrap_object(el)
+        return el
+
+    def _emit_vertex(self) -> ET.Element:
         attrib: dict[str, str] = {"id": self.id}
         if self.value:
             # Unescape pre-escaped HTML (e.g. &lt;b&gt; → <b>) so that
             # ET.tostring produces correct single-level escaping.
             attrib["value"] = _html.unescape(self.value)
+        if self.style:
+            attrib["style"] = self.style
+        if self.parent:
+            attrib["parent"] = self.parent
+        attrib["vertex"] = "1"
+        if self.connectable is not None and not self.connectable:
+            attrib["connectable"] = "0"
+        if self.collapsed:
+            attrib["collapsed"] = "1"
+        if not self.visible:
+            attrib["visible"] = "0"
+        return ET.Element("mxCell", attrib=attrib)
+
+    def _emit_edge(self) -> ET.Element:
+        attrib: dict[str, str] = {"id": self.id}
+        if self.value:
+            attrib["value"] = _html.unescape(self.value)
         # Inject connection port constraints into style
         style = self.style or ""
-        if self.edge:
-            port_parts: list[str] = []
-            if self.exit_x is not None:
-                port_parts.append(f"exitX={self.exit_x}")
-                port_parts.append(f"exitY={self.exit_y if self.exit_y is not None else 0}")
-                port_parts.append(f"exitDx={self.exit_dx}")
-                port_parts.append(f"exitDy={self.exit_dy}")
-                port_parts.append("exitPerimeter=0")
-            if self.entry_x is not None:
-                port_parts.append(f"entryX={self.entry_x}")
-                port_parts.append(f"entryY={self.entry_y if self.entry_y is not None else 0}")
-                port_parts.append(f"entryDx={self.entry_dx}")
-                port_parts.append(f"entryDy={self.entry_dy}")
-                port_parts.append("entryPerimeter=0")
-            if port_parts:
-                style = style.rstrip(";") + ";" + ";".join(port_parts) + ";"
+        port_parts: list[str] = []
+        if self.exit_x is not None:
+            port_parts.append(f"exitX={self.exit_x}")
+            port_parts.append(f"exitY={self.exit_y if self.exit_y is not None else 0}")
+            port_parts.append(f"exitDx={self.exit_dx}")
+            port_parts.append(f"exitDy={self.exit_dy}")
+            port_parts.append("exitPerimeter=0")
+        if self.entry_x is not None:
+            port_parts.append(f"entryX={self.entry_x}")
+            port_parts.append(f"entryY={self.entry_y if self.entry_y is not None else 0}")
+            port_parts.append(f"entryDx={self.entry_dx}")
+            port_parts.append(f"entryDy={self.entry_dy}")
+            port_parts.append("entryPerimeter=0")
+        if port_parts:
+            style = style.rstrip(";") + ";" + ";".join(port_parts) + ";"
         if style:
             attrib["style"] = style
         if self.parent:
             attrib["parent"] = self.parent
-        if self.vertex:
-            attrib["vertex"] = "1"
-        if self.edge:
-            attrib["edge"] = "1"
+        attrib["edge"] = "1"
         if self.source:
             attrib["source"] = self.source
         if self.target:
@@ -194,32 +235,45 @@ class MxCell:
             attrib["collapsed"] = "1"
         if not self.visible:
             attrib["visible"] = "0"
-        el = ET.Element("mxCell", attrib=attrib)
-        if self.geometry:
-            el.append(self.geometry.to_element())
+        return ET.Element("mxCell", attrib=attrib)
 
-        # Wrap in <object> if metadata fields are set
-        if self._has_object_wrapper:
-            obj_attrib: dict[str, str] = {
-                "label": attrib.pop("value", ""),
-                "id": self.id,
-            }
-            if self.tooltip:
-                obj_attrib["tooltip"] = self.tooltip
-            if self.link:
-                obj_attrib["link"] = self.link
-            if self.placeholders:
-                obj_attrib["placeholders"] = "1"
-            for k, v in self.metadata.items():
-                obj_attrib[k] = v
-            # Remove id and value from inner mxCell — they move to <object>
-            el.attrib.pop("id", None)
-            el.attrib.pop("value", None)
-            wrapper = ET.Element("object", attrib=obj_attrib)
-            wrapper.append(el)
-            return wrapper
+    def _emit_structural(self) -> ET.Element:
+        """Emit a structural cell (root, default layer, or user layer)."""
+        attrib: dict[str, str] = {"id": self.id}
+        if self.value:
+            attrib["value"] = _html.unescape(self.value)
+        if self.style:
+            attrib["style"] = self.style
+        if self.parent:
+            attrib["parent"] = self.parent
+        if self.connectable is not None and not self.connectable:
+            attrib["connectable"] = "0"
+        if self.collapsed:
+            attrib["collapsed"] = "1"
+        if not self.visible:
+            attrib["visible"] = "0"
+        return ET.Element("mxCell", attrib=attrib)
 
-        return el
+    def _wrap_object(self, el: ET.Element) -> ET.Element:
+        """Wrap an mxCell element in an <object> carrying metadata."""
+        obj_attrib: dict[str, str] = {
+            "label": el.attrib.get("value", ""),
+            "id": self.id,
+        }
+        if self.tooltip:
+            obj_attrib["tooltip"] = self.tooltip
+        if self.link:
+            obj_attrib["link"] = self.link
+        if self.placeholders:
+            obj_attrib["placeholders"] = "1"
+        for k, v in self.metadata.items():
+            obj_attrib[k] = v
+        # Remove id and value from inner mxCell — they move to <object>
+        el.attrib.pop("id", None)
+        el.attrib.pop("value", None)
+        wrapper = ET.Element("object", attrib=obj_attrib)
+        wrapper.append(el)
+        return wrapper
 
 
 @dataclass
@@ -249,6 +303,18 @@ class Diagram:
     # internal counter
     _next_id: int = field(default=2, init=False, repr=False)
 
+    # Fingerprint of cell content after the last polish pass plus the
+    # result string it produced; lets server polish skip a re-run when
+    # nothing has changed in between.  Self-invalidating: any geometry,
+    # style, or topology mutation yields a different fingerprint.
+    _polish_hash: Optional[int] = field(default=None, init=False, repr=False, compare=False)
+    _polish_result: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+
+    # Id -> cell lookup maintained alongside `cells`.  The builder
+    # helpers keep it current; code that mutates the cell list directly
+    # must call reindex_cells() afterwards.
+    _cell_index: dict[str, 'MxCell'] = field(default_factory=dict, init=False, repr=False, compare=False)
+
     def __post_init__(self) -> None:
         # Ensure structural cells 0 and 1 always exist
         if self.cells is None:
@@ -256,6 +322,7 @@ class Diagram:
                 MxCell(id="0", parent=""),
                 MxCell(id="1", parent="0"),
             ]
+        self._cell_index = {c.id: c for c in self.cells}
 
     def set_page_format(self, fmt: PageFormat) -> None:
         w, h = fmt.value
@@ -272,6 +339,20 @@ class Diagram:
         self._next_id += 1
         return cid
 
+    def reserve_ids(self, count: int) -> list[str]:
+        """Reserve a contiguous block of sequential cell IDs in one step."""
+        start = self._next_id
+        self._next_id = start + count
+        return [str(i) for i in range(start, start + count)]
+
+    def find_cell(self, cell_id: str) -> Optional[MxCell]:
+        """Look up a cell by id via the maintained index."""
+        return self._cell_index.get(cell_id)
+
+    def reindex_cells(self) -> None:
+        """Rebuild the id index after mutating the cell list directly."""
+        self._cell_index = {c.id: c for c in self.cells}
+
     # ----- builder helpers -----
 
     def add_vertex(
@@ -295,6 +376,7 @@ class Diagram:
             geometry=Geometry(x=x, y=y, width=width, height=height),
         )
         self.cells.append(cell)
+        self._cell_index[cid] = cell
         return cid
 
     def add_edge(
@@ -322,6 +404,7 @@ class Diagram:
             geometry=geom,
         )
         self.cells.append(cell)
+        self._cell_index[cid] = cell
         return cid
 
     def add_layer(
@@ -346,6 +429,7 @@ class Diagram:
             visible=visible,
         )
         self.cells.append(cell)
+        self._cell_index[cid] = cell
         return cid
 
     def get_layers(self) -> list[MxCell]:
@@ -377,6 +461,7 @@ class Diagram:
             geometry=Geometry(x=x, y=y, width=width, height=height),
         )
         self.cells.append(cell)
+        self._cell_index[cid] = cell
         return cid
 
     def add_edge_label(
@@ -402,6 +487,7 @@ class Diagram:
             geometry=geom,
         )
         self.cells.append(cell)
+        self._cell_index[cid] = cell
         return cid
 
     def to_element(self) -> ET.Element:
@@ -425,8 +511,7 @@ class Diagram:
         }
         model = ET.Element("mxGraphModel", attrib=graph_attrs)
         root = ET.SubElement(model, "root")
-        for cell in self.cells:
-            root.append(cell.to_element())
+        root.extend(cell.to_element() for cell in self.cells)
 
         diagram = ET.Element("diagram", attrib={"name": self.name, "id": self.id})
         diagram.append(model)
@@ -441,6 +526,9 @@ class DrawioFile:
     type: str = "device"
     agent: str = "drawio-mcp/1.0"
     version: str = "24.7.17"
+    # Cached pretty serialization; cleared via invalidate_xml_cache() whenever
+    # the document may have mutated.
+    _xml_cache: Optional[str] = field(default=None, init=False, repr=False, compare=False)
 
     def __post_init__(self) -> None:
         if self.diagrams is None:
@@ -453,9 +541,14 @@ class DrawioFile:
     def add_diagram(self, name: str = "Page-2") -> Diagram:
         d = Diagram(name=name)
         self.diagrams.append(d)
+        self.invalidate_xml_cache()
         return d
 
-    def to_xml(self, pretty: bool = True) -> str:
+    def invalidate_xml_cache(self) -> None:
+        """Drop the cached serialization after any mutation of the document."""
+        self._xml_cache = None
+
+    def _build_tree(self, pretty: bool = True) -> ET.Element:
         import datetime
         mxfile = ET.Element(
             "mxfile",
@@ -470,12 +563,33 @@ class DrawioFile:
                 "compressed": "false",
             },
         )
-        for d in self.diagrams:
-            mxfile.append(d.to_element())
+        mxfile.extend(d.to_element() for d in self.diagrams)
         if pretty:
             ET.indent(mxfile, space="  ")
-        return '<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(
-            mxfile, encoding="unicode"
+        return mxfile
+
+    def to_xml(self, pretty: bool = True) -> str:
+        if pretty and self._xml_cache is not None:
+            return self._xml_cache
+        xml = '<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(
+            self._build_tree(pretty), encoding="unicode"
+        )
+        if pretty:
+            self._xml_cache = xml
+        return xml
+
+    def write_xml(self, fp, pretty: bool = True) -> None:
+        """Stream the document into a binary file object.
+
+        Unlike ``to_xml()`` + ``write_text()``, this never holds both the
+        full XML string and its UTF-8 encoding in memory at once.
+        """
+        if pretty and self._xml_cache is not None:
+            fp.write(self._xml_cache.encode("utf-8"))
+            return
+        fp.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
+        ET.ElementTree(self._build_tree(pretty)).write(
+            fp, encoding="utf-8", xml_declaration=False
         )
 
 
@@ -492,7 +606,7 @@ def snap_to_grid(value: float, grid_size: int = 10) -> float:
     return round(value / grid_size) * grid_size
 
 
-@dataclass
+@dataclass(slots=True)
 class CellBounds:
     """Axis-aligned bounding box for a cell."""
     x: float
@@ -15,12 +15,19 @@ Tools:
 
 from __future__ import annotations
 
+import functools
 import json
 import logging
+import operator
+import os
 import re
 import threading
+import xml.etree.ElementTree as ET
+from io import StringIO
+from collections import OrderedDict, deque
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
 
 from mcp.server.fastmcp import FastMCP
 
@@ -55,22 +62,10 @@ from drawio_mcp.layout import (
     layout_tree,
     layout_vertical,
 )
-from drawio_mcp.layout_engine import (
-    LayoutEngineConfig,
-    align_column_centers,
-    align_rank_baselines,
-    center_diagram_on_page,
-    compact_diagram,
-    ensure_page_margins,
-    equalize_connected_sizes,
-    find_overlapping_cells,
-    layout_sugiyama,
-    optimize_edge_paths,
-    position_edge_labels,
-    relayout_diagram,
-    resolve_overlaps,
-    route_edges_around_obstacles,
-)
+# drawio_mcp.layout_engine (sugiyama, A* routing, overlap resolution) is by
+# far the largest module in the package and is only needed once a tool call
+# actually lays something out; it is imported lazily inside those handlers
+# so a server that only answers resource/list requests never pays for it.
 from drawio_mcp.validation import (
     ValidationError,
     validate_action,
@@ -116,6 +111,11 @@ from drawio_mcp.validation import (
 logging.getLogger("mcp.server").setLevel(logging.WARNING)
 logger = logging.getLogger("drawio-mcp")
 
+# ---------------------------------------------------------------------------
+# Precompiled regex patterns (hot paths — avoid per-call compile-cache lookups)
+# ---------------------------------------------------------------------------
+_STARTSIZE_PAT = re.compile(r"startSize=(\d+)")
+
 # ---------------------------------------------------------------------------
 # MCP Server
 # ---------------------------------------------------------------------------
@@ -160,61 +160,168 @@ mcp = FastMCP(
     ),
 )
 
-# In-memory diagram registry: name -> DrawioFile
+# In-memory diagram registry: name -> DrawioFile, LRU-ordered so that
+# long-running servers don't accumulate diagrams without bound.
 # Guarded by _diagrams_lock for thread-safety.
-_diagrams: dict[str, DrawioFile] = {}
-_diagrams_lock = threading.Lock()
+_diagrams: OrderedDict[str, DrawioFile] = OrderedDict()
+_diagrams_lock = threading.RLock()
+_MAX_DIAGRAMS = int(os.environ.get("DRAWIO_MCP_MAX_DIAGRAMS", "64"))
+
+# C-level attribute accessors for tight counting loops.
+_cell_vertex = operator.attrgetter("vertex")
+_cell_edge = operator.attrgetter("edge")
+_geo_x = operator.attrgetter("x")
+_geo_y = operator.attrgetter("y")
+_item0 = operator.itemgetter(0)
+
+# Plain dict view of the PageFormat members — skips enum __getitem__ overhead.
+_PAGE_FORMAT_MAP: dict[str, PageFormat] = dict(PageFormat.__members__)
+
+# IDs of the structural root/layer cells that styling passes must skip.
+_STRUCTURAL_IDS = frozenset({"0", "1"})
+
+# Parent ids that mean "top level" for coordinate conversion — the layer,
+# the root, or an unset parent.
+_ROOT_PARENT_IDS = frozenset({"0", "1", ""})
+
+# Hop cap for ancestor walks; real diagrams nest a few levels deep, so
+# hitting this means the parent chain is cyclic or corrupt.
+_MAX_NESTING_DEPTH = 64
+
+# Flowchart step type -> preset style, sizes, and connector style — constant
+# per call, so built once at import.
+_FLOWCHART_TYPE_MAP: dict[str, str] = {
+    "process": VertexStyle.FLOWCHART_PROCESS,
+    "decision": VertexStyle.FLOWCHART_DECISION,
+    "terminator": VertexStyle.FLOWCHART_TERMINATOR,
+    "data": VertexStyle.FLOWCHART_DATA,
+    "predefined": VertexStyle.FLOWCHART_PREDEFINED,
+    "manual_input": VertexStyle.FLOWCHART_MANUAL_INPUT,
+    "preparation": VertexStyle.FLOWCHART_PREPARATION,
+    "delay": VertexStyle.FLOWCHART_DELAY,
+    "display": VertexStyle.FLOWCHART_DISPLAY,
+    "stored_data": VertexStyle.FLOWCHART_STORED_DATA,
+}
+_FLOWCHART_SIZES: dict[str, tuple[int, int]] = {"decision": (160, 80)}
+_FLOWCHART_DEFAULT_SIZE = (120, 60)
+_FLOWCHART_EDGE_STYLE = (
+    "edgeStyle=orthogonalEdgeStyle;rounded=0;orthogonalLoop=1;"
+    "jettySize=auto;html=1;endArrow=classic;"
+)
+
+
+def _err(exc: ValidationError) -> str:
+    """Shared formatter for the tool-level validation error responses."""
+    return "Error: " + exc.message
+
+
+# Shared JSON encoders: json.dumps constructs a fresh JSONEncoder on
+# every call when passed non-default arguments, so bind one instance of
+# each flavor instead.  _dumps is the compact form for machine-consumed
+# tool responses (C-accelerated path); _pretty_encode serves the
+# human-readable inspect responses, where indent forces the pure-Python
+# encoding path anyway.
+_dumps = json.JSONEncoder(separators=(",", ":")).encode
+_pretty_encode = json.JSONEncoder(indent=2).encode
+
+
+def _lookup_diagram(name: str) -> DrawioFile | None:
+    """Fetch a registered DrawioFile under the registry lock."""
+    with _diagrams_lock:
+        df = _diagrams.get(name)
+        if df is not None:
+            _diagrams.move_to_end(name)
+        return df
+
+
+def _register_diagram(name: str, df: DrawioFile) -> None:
+    """Insert or replace a diagram, evicting the least recently used over capacity."""
+    with _diagrams_lock:
+        _diagrams[name] = df
+        _diagrams.move_to_end(name)
+        while len(_diagrams) > _MAX_DIAGRAMS:
+            evicted, _df = _diagrams.popitem(last=False)
+            logger.warning("Diagram registry full; evicted least recently used '%s'.", evicted)
 
 
 # ===================================================================
 # RESOURCES — provide style catalogs to the LLM
 # ===================================================================
 
+# Public preset entries, computed once — the preset classes are immutable
+# at runtime, so the name filtering never needs to run again.
+_VERTEX_PRESET_ITEMS: tuple[tuple[str, str], ...] = tuple(
+    (name, val) for name, val in sorted(vars(VertexStyle).items())
+    if not name.startswith("_") and isinstance(val, str)
+)
+_EDGE_PRESET_ITEMS: tuple[tuple[str, str], ...] = tuple(
+    (name, val) for name, val in sorted(vars(EdgeStylePreset).items())
+    if not name.startswith("_") and isinstance(val, str)
+)
+_THEME_ITEMS: tuple[tuple[str, ColorTheme], ...] = tuple(
+    (name, val) for name, val in sorted(vars(Themes).items())
+    if not name.startswith("_") and isinstance(val, ColorTheme)
+)
+
+
+def _build_vertex_catalog() -> str:
+    return "Available vertex style presets:\n" + "\n".join(
+        f"  {name}: {val}" for name, val in _VERTEX_PRESET_ITEMS
+    )
+
+
+def _build_edge_catalog() -> str:
+    return "Available edge style presets:\n" + "\n".join(
+        f"  {name}: {val}" for name, val in _EDGE_PRESET_ITEMS
+    )
+
+
+def _build_theme_catalog() -> str:
+    return "Available color themes:\n" + "\n".join(
+        f"  {name}: {val}" for name, val in _THEME_ITEMS
+    )
+
+
+# Preset classes are immutable at runtime — build each catalog string once
+# at import instead of re-walking dir()/getattr on every resource fetch.
+_VERTEX_CATALOG_STR = _build_vertex_catalog()
+_EDGE_CATALOG_STR = _build_edge_catalog()
+_THEME_CATALOG_STR = _build_theme_catalog()
+
+# Same data with the shorter headers used by the style() list_* actions.
+_VERTEX_PRESETS_STR = "Vertex style presets:\n" + "\n".join(
+    f"  {name}: {val}" for name, val in _VERTEX_PRESET_ITEMS
+)
+_EDGE_PRESETS_STR = "Edge style presets:\n" + "\n".join(
+    f"  {name}: {val}" for name, val in _EDGE_PRESET_ITEMS
+)
+_THEMES_STR = "Color themes:\n" + "\n".join(
+    f"  {name}: {val}" for name, val in _THEME_ITEMS
+)
+
+
 @mcp.resource("drawio://styles/vertices")
 def vertex_style_catalog() -> str:
     """Return all available vertex style presets as a reference."""
-    entries: list[str] = []
-    for name in sorted(dir(VertexStyle)):
-        if name.startswith("_"):
-            continue
-        val = getattr(VertexStyle, name)
-        if isinstance(val, str):
-            entries.append(f"  {name}: {val}")
-    return "Available vertex style presets:\n" + "\n".join(entries)
+    return _VERTEX_CATALOG_STR
 
 
 @mcp.resource("drawio://styles/edges")
 def edge_style_catalog() -> str:
     """Return all available edge style presets as a reference."""
-    entries: list[str] = []
-    for name in sorted(dir(EdgeStylePreset)):
-        if name.startswith("_"):
-            continue
-        val = getattr(EdgeStylePreset, name)
-        if isinstance(val, str):
-            entries.append(f"  {name}: {val}")
-    return "Available edge style presets:\n" + "\n".join(entries)
+    return _EDGE_CATALOG_STR
 
 
 @mcp.resource("drawio://styles/themes")
 def theme_catalog() -> str:
     """Return all available color themes."""
-    entries: list[str] = []
-    for name in sorted(dir(Themes)):
-        if name.startswith("_"):
-            continue
-        val = getattr(Themes, name)
-        if isinstance(val, ColorTheme):
-            entries.append(
-                f"  {name}: fill={val.fill} stroke={val.stroke} font={val.font}"
-            )
-    return "Available color themes:\n" + "\n".join(entries)
+    return _THEME_CATALOG_STR
 
 
-@mcp.resource("drawio://guide/agent")
-def agent_guide() -> str:
-    """Comprehensive guide for AI agents on how to use the draw.io MCP tools effectively."""
-    return """# Draw.io MCP — Agent Guide
+# The guide is a multi-kilobyte constant; keep it at module scope so the
+# resource handler is a plain global lookup rather than re-materializing
+# the literal inside a call frame.
+_AGENT_GUIDE = """# Draw.io MCP — Agent Guide
 
 You have 5 tools. Each tool uses an `action` parameter to pick the operation.
 This guide teaches you HOW and WHEN to use them for best results.
@@ -413,6 +520,163 @@ These happen transparently — you don't need to do anything:
 """
 
 
+@mcp.resource("drawio://guide/agent", mime_type="text/markdown")
+def agent_guide() -> str:
+    """Comprehensive guide for AI agents on how to use the draw.io MCP tools effectively."""
+    return _AGENT_GUIDE
+
+
+
+# ---------------------------------------------------------------------------
+# diagram() action handlers — dispatched via _DIAGRAM_HANDLERS below
+# ---------------------------------------------------------------------------
+
+@dataclass(slots=True, frozen=True)
+class _DiagramArgs:
+    """Bundled diagram() parameters — one slotted object instead of a kwargs dict per dispatch."""
+    name: str = ""
+    file_path: str = ""
+    xml_content: str = ""
+    page_format: str = "A4_PORTRAIT"
+    background: str = "none"
+    grid: bool = True
+    grid_size: int = 10
+    page_name: str = ""
+
+
+def _diagram_create(args: _DiagramArgs) -> str:
+    try:
+        name = validate_non_empty_string(args.name, "name")
+        page_format = validate_page_format(args.page_format)
+        validate_color(args.background, "background", allow_none=True)
+        validate_grid_size(args.grid_size)
+    except ValidationError as exc:
+        return _err(exc)
+    # validate_page_format already returned the normalized uppercase name.
+    fmt = _PAGE_FORMAT_MAP[page_format]
+    df = DrawioFile()
+    d = df.active_diagram
+    d.name = name
+    d.set_page_format(fmt)
+    d.background = args.background
+    d.grid = args.grid
+    d.grid_size = args.grid_size
+    _register_diagram(name, df)
+    return f"Diagram '{name}' created ({page_format})."
+
+
+def _diagram_save(args: _DiagramArgs) -> str:
+    try:
+        name = validate_non_empty_string(args.name, "name")
+        validate_file_path(args.file_path, "file_path")
+    except ValidationError as exc:
+        return _err(exc)
+    df = _lookup_diagram(name)
+    if not df:
+        return f"Error: diagram '{name}' not found."
+    path = Path(args.file_path).resolve()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a sibling temp file and rename into place so a crash or
+    # concurrent save can never leave a half-written .drawio behind.
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        with open(tmp, "wb") as fp:
+            df.write_xml(fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp, path)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        raise
+    return f"Diagram saved to {path}"
+
+
+def _diagram_load(args: _DiagramArgs) -> str:
+    try:
+        name = validate_non_empty_string(args.name, "name")
+        validate_file_path(args.file_path, "file_path")
+    except ValidationError as exc:
+        return _err(exc)
+    return _import_xml_from_path(name, Path(args.file_path))
+
+
+def _diagram_import_xml(args: _DiagramArgs) -> str:
+    try:
+        name = validate_non_empty_string(args.name, "name")
+        validate_non_empty_string(args.xml_content, "xml_content")
+    except ValidationError as exc:
+        return _err(exc)
+    return _import_xml_impl(name, args.xml_content)
+
+
+def _diagram_list(args: _DiagramArgs) -> str:
+    # Snapshot under the lock; do the per-page counting outside it.
+    with _diagrams_lock:
+        snapshot = list(_diagrams.items())
+    result: list[dict[str, Any]] = []
+    for n, df in snapshot:
+        pages: list[dict[str, Any]] = []
+        for i, d in enumerate(df.diagrams):
+            # map + attrgetter keeps the per-cell work in C; two C-speed
+            # passes beat one Python-level loop here.
+            pages.append({"index": i, "name": d.name,
+                          "vertices": sum(map(_cell_vertex, d.cells)),
+                          "edges": sum(map(_cell_edge, d.cells))})
+        result.append({"name": n, "pages": pages})
+    # Machine-consumed response — compact separators keep json on its C path.
+    return _dumps(result)
+
+
+def _diagram_get_xml(args: _DiagramArgs) -> str:
+    try:
+        name = validate_non_empty_string(args.name, "name")
+    except ValidationError as exc:
+        return _err(exc)
+    df = _lookup_diagram(name)
+    if not df:
+        return f"Error: diagram '{name}' not found."
+    return df.to_xml()
+
+
+def _diagram_add_page(args: _DiagramArgs) -> str:
+    try:
+        name = validate_non_empty_string(args.name, "name")
+    except ValidationError as exc:
+        return _err(exc)
+    df = _lookup_diagram(name)
+    if not df:
+        return f"Error: diagram '{name}' not found."
+    df.add_diagram(args.page_name or "Page-2")
+    return f"Page '{args.page_name}' added to diagram '{name}'."
+
+
+def _diagram_add_layer(args: _DiagramArgs) -> str:
+    try:
+        name = validate_non_empty_string(args.name, "name")
+        page_name = validate_non_empty_string(args.page_name, "page_name")
+    except ValidationError as exc:
+        return _err(exc)
+    df = _lookup_diagram(name)
+    if not df:
+        return f"Error: diagram '{name}' not found."
+    df.invalidate_xml_cache()
+    d = df.diagrams[0]
+    layer_id = d.add_layer(page_name)
+    return _dumps({"layer_id": layer_id, "name": page_name})
+
+
+_DIAGRAM_HANDLERS: dict[str, Callable[[_DiagramArgs], str]] = {
+    "create": _diagram_create,
+    "save": _diagram_save,
+    "load": _diagram_load,
+    "import_xml": _diagram_import_xml,
+    "list": _diagram_list,
+    "get_xml": _diagram_get_xml,
+    "add_page": _diagram_add_page,
+    "add_layer": _diagram_add_layer,
+}
+
+
 # ===================================================================
 # TOOL 1: diagram — lifecycle
 # ===================================================================
@@ -461,111 +725,454 @@ def diagram(
     try:
         action = validate_action(action, "diagram", _DIAGRAM_ACTIONS)
     except ValidationError as exc:
-        return f"Error: {exc.message}"
+        return _err(exc)
+    handler = _DIAGRAM_HANDLERS.get(action)
+    if handler is None:
+        return (f"Error: unknown diagram action '{action}'. "
+                "Use: create, save, load, import_xml, list, get_xml, add_page, add_layer.")
+    return handler(_DiagramArgs(
+        name=name, file_path=file_path, xml_content=xml_content,
+        page_format=page_format, background=background, grid=grid,
+        grid_size=grid_size, page_name=page_name,
+    ))
 
-    if action == "create":
-        try:
-            name = validate_non_empty_string(name, "name")
-            page_format = validate_page_format(page_format)
-            validate_color(background, "background", allow_none=True)
-            validate_grid_size(grid_size)
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        fmt = PageFormat[page_format.upper()]
-        df = DrawioFile()
-        d = df.active_diagram
-        d.name = name
-        d.set_page_format(fmt)
-        d.background = background
-        d.grid = grid
-        d.grid_size = grid_size
-        with _diagrams_lock:
-            _diagrams[name] = df
-        return f"Diagram '{name}' created ({page_format})."
-
-    elif action == "save":
-        try:
-            name = validate_non_empty_string(name, "name")
-            validate_file_path(file_path, "file_path")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        df = _diagrams.get(name)
-        if not df:
-            return f"Error: diagram '{name}' not found."
-        path = Path(file_path)
-        path.parent.mkdir(parents=True, exist_ok=True)
-        xml = df.to_xml()
-        path.write_text(xml, encoding="utf-8")
-        return f"Diagram saved to {path.resolve()}"
-
-    elif action == "load":
-        try:
-            name = validate_non_empty_string(name, "name")
-            validate_file_path(file_path, "file_path")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        path = Path(file_path)
-        if not path.exists():
-            return f"Error: file '{file_path}' not found."
-        xml = path.read_text(encoding="utf-8")
-        return _import_xml_impl(name, xml)
-
-    elif action == "import_xml":
-        try:
-            name = validate_non_empty_string(name, "name")
-            validate_non_empty_string(xml_content, "xml_content")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        return _import_xml_impl(name, xml_content)
-
-    elif action == "list":
-        result: list[dict[str, Any]] = []
-        for n, df in _diagrams.items():
-            pages: list[dict[str, Any]] = []
-            for i, d in enumerate(df.diagrams):
-                vertex_count = sum(1 for c in d.cells if c.vertex)
-                edge_count = sum(1 for c in d.cells if c.edge)
-                pages.append({"index": i, "name": d.name,
-                              "vertices": vertex_count, "edges": edge_count})
-            result.append({"name": n, "pages": pages})
-        return json.dumps(result, indent=2)
-
-    elif action == "get_xml":
-        try:
-            name = validate_non_empty_string(name, "name")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        df = _diagrams.get(name)
-        if not df:
-            return f"Error: diagram '{name}' not found."
-        return df.to_xml()
 
-    elif action == "add_page":
-        try:
-            name = validate_non_empty_string(name, "name")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        df = _diagrams.get(name)
-        if not df:
-            return f"Error: diagram '{name}' not found."
-        df.add_diagram(page_name or "Page-2")
-        return f"Page '{page_name}' added to diagram '{name}'."
+# ---------------------------------------------------------------------------
+# draw() action handlers — dispatched via _DRAW_HANDLERS below
+# ---------------------------------------------------------------------------
+
+# Static styles used by the title/legend paths — resolved once at import.
+_TITLE_STYLE = VertexStyle.TITLE
+_SUBTITLE_STYLE = VertexStyle.SUBTITLE
+_LEGEND_CONTAINER_STYLE = (
+    "swimlane;fontStyle=1;childLayout=stackLayout;horizontal=1;"
+    "startSize=26;fillColor=#ffffff;horizontalStack=0;"
+    "resizeParent=1;resizeParentMax=0;resizeLast=0;collapsible=0;"
+    "marginBottom=0;strokeColor=#666666;html=1;"
+)
+_LEGEND_ITEM_STYLE_FMT = (
+    "text;align=left;verticalAlign=top;spacingLeft=4;spacingRight=4;"
+    "overflow=hidden;rotatable=0;points=[[0,0.5],[1,0.5]];"
+    "portConstraint=eastwest;fillColor={};strokeColor={};html=1;"
+)
 
-    elif action == "add_layer":
-        try:
-            name = validate_non_empty_string(name, "name")
-            validate_non_empty_string(page_name, "page_name")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        df = _diagrams.get(name)
-        if not df:
-            return f"Error: diagram '{name}' not found."
-        d = df.diagrams[0]
-        layer_id = d.add_layer(page_name)
-        return json.dumps({"layer_id": layer_id, "name": page_name})
 
+def _draw_add_vertices(d: Diagram, *, vertices: list[dict[str, Any]] | None, **_: Any) -> str:
+    verts = vertices or []
+    try:
+        validate_list(verts, "vertices", min_length=1)
+        for i, v in enumerate(verts):
+            validate_vertex_dict(v, i)
+    except ValidationError as exc:
+        return _err(exc)
+    ids: list[str] = []
+    gs = d.grid_size
+    for i, v in enumerate(verts):
+        vstyle = v.get("custom_style") or _resolve_vertex_style(v.get("style_preset", ""))
+        pid = v.get("parent_id", "1")
+        vw, vh = _estimate_size(v["label"], v.get("width", 120), v.get("height", 60))
+        # Inline snap_to_grid: avoids two function calls and two attribute
+        # reads per vertex in this batch loop.
+        gx = round(v["x"] / gs) * gs
+        gy = round(v["y"] / gs) * gs
+        rx, ry = _abs_to_relative(d, gx, gy, pid)
+        cid = d.add_vertex(v["label"], rx, ry, vw, vh, vstyle, pid, v.get("cell_id") or None)
+        # Apply metadata if provided; the new vertex is the last cell appended.
+        cell = d.cells[-1]
+        if cell:
+            if v.get("tooltip"):
+                cell.tooltip = v["tooltip"]
+            if v.get("link"):
+                cell.link = v["link"]
+            if v.get("metadata") and isinstance(v["metadata"], dict):
+                cell.metadata = v["metadata"]
+        ids.append(cid)
+    return _dumps(ids)
+
+
+def _draw_add_edges(d: Diagram, *, edges: list[dict[str, Any]] | None, **_: Any) -> str:
+    edge_list = edges or []
+    try:
+        validate_list(edge_list, "edges", min_length=1)
+        for i, e in enumerate(edge_list):
+            validate_edge_dict(e, i)
+    except ValidationError as exc:
+        return _err(exc)
+    ids = []
+    bounds = get_all_vertex_bounds(d)
+    parents = _parent_map(d)
+    explicit_ports: dict[int, tuple[str, str]] = {
+        i: (e.get("exit_port", ""), e.get("entry_port", ""))
+        for i, e in enumerate(edge_list)
+        if e.get("exit_port") or e.get("entry_port")
+    }
+
+    # Batches are almost always either fully auto-routed or fully pinned;
+    # only the mixed case needs the index bookkeeping. auto_pos maps edge
+    # index -> position in the auto-routed batch, identity when None.
+    auto_pos: dict[int, int] | None = None
+    if not explicit_ports:
+        batch_ports = distribute_ports_for_batch(
+            [(e["source_id"], e["target_id"]) for e in edge_list], bounds,
+        )
+    elif len(explicit_ports) == len(edge_list):
+        batch_ports = []
     else:
-        return f"Error: unknown diagram action '{action}'. Use: create, save, load, import_xml, list, get_xml, add_page, add_layer."
+        auto_indices = [i for i in range(len(edge_list)) if i not in explicit_ports]
+        batch_ports = distribute_ports_for_batch(
+            [(edge_list[i]["source_id"], edge_list[i]["target_id"]) for i in auto_indices],
+            bounds,
+        )
+        auto_pos = {idx: pos for pos, idx in enumerate(auto_indices)}
+
+    for i, e in enumerate(edge_list):
+        src_id = e["source_id"]
+        tgt_id = e["target_id"]
+        estyle = e.get("custom_style") or _resolve_edge_style(e.get("style_preset", ""))
+        ep = e.get("parent_id", "")
+        if not ep or ep == "1":
+            ep = _common_parent(parents, src_id, tgt_id)
+
+        cid = d.add_edge(src_id, tgt_id, e.get("label", ""), estyle, ep)
+
+        # Port resolution — the new edge is the last cell appended.
+        edge_cell = d.cells[-1]
+        if edge_cell:
+            if i in explicit_ports:
+                exit_name, entry_name = explicit_ports[i]
+                ex, ey, enx, eny = _resolve_ports(d, src_id, tgt_id, exit_name, entry_name, False)
+            else:
+                batch_idx = i if auto_pos is None else auto_pos.get(i, -1)
+                if batch_idx >= 0 and batch_idx < len(batch_ports):
+                    (ex, ey), (enx, eny) = batch_ports[batch_idx]
+                else:
+                    # Vertices don't move while edges are appended, so the
+                    # bounds computed at the top of the branch stay valid.
+                    ex, ey, enx, eny = _resolve_ports(d, src_id, tgt_id, "", "", True, bounds)
+            if ex is not None:
+                edge_cell.exit_x = ex
+                edge_cell.exit_y = ey
+            if enx is not None:
+                edge_cell.entry_x = enx
+                edge_cell.entry_y = eny
+        ids.append(cid)
+
+    # Route edges around obstacles
+    from drawio_mcp.layout_engine import route_edges_around_obstacles
+
+    route_edges_around_obstacles(d, margin=15)
+    return _dumps(ids)
+
+
+def _draw_add_group(
+    d: Diagram, *, group_label: str, group_x: float, group_y: float,
+    group_width: float, group_height: float, group_style_preset: str,
+    group_custom_style: str, group_parent_id: str, **_: Any,
+) -> str:
+    try:
+        validate_non_empty_string(group_label, "group_label")
+        validate_number(group_x, "group_x")
+        validate_number(group_y, "group_y")
+        validate_positive_number(group_width, "group_width")
+        validate_positive_number(group_height, "group_height")
+    except ValidationError as exc:
+        return _err(exc)
+    gstyle = group_custom_style or _resolve_vertex_style(group_style_preset)
+    gx = snap_to_grid(group_x, d.grid_size)
+    gy = snap_to_grid(group_y, d.grid_size)
+    rx, ry = _abs_to_relative(d, gx, gy, group_parent_id)
+    cid = d.add_group(group_label, rx, ry, group_width, group_height, gstyle, group_parent_id)
+    return cid
+
+
+def _draw_update_cells(d: Diagram, *, updates: list[dict[str, Any]] | None, **_: Any) -> str:
+    upd_list = updates or []
+    try:
+        validate_list(upd_list, "updates", min_length=1)
+        for i, u in enumerate(upd_list):
+            validate_update_dict(u, i)
+    except ValidationError as exc:
+        return _err(exc)
+    results: list[str] = []
+    by_id = {c.id: c for c in d.cells}
+    for u in upd_list:
+        cell = by_id.get(u["cell_id"])
+        if not cell:
+            results.append(f"not_found:{u['cell_id']}")
+            continue
+        if "label" in u:
+            cell.value = u["label"]
+        if "style" in u:
+            cell.style = u["style"]
+        if cell.geometry:
+            if "x" in u:
+                cell.geometry.x = snap_to_grid(u["x"], d.grid_size)
+            if "y" in u:
+                cell.geometry.y = snap_to_grid(u["y"], d.grid_size)
+            if "width" in u:
+                cell.geometry.width = u["width"]
+            if "height" in u:
+                cell.geometry.height = u["height"]
+        results.append(f"ok:{u['cell_id']}")
+    return _dumps(results)
+
+
+def _draw_delete_cells(d: Diagram, *, cell_ids: list[str] | None, **_: Any) -> str:
+    try:
+        validate_list(cell_ids or [], "cell_ids", min_length=1)
+    except ValidationError as exc:
+        return _err(exc)
+    to_delete = set(cell_ids or [])
+    # Build dependency adjacency once, then cascade with a BFS instead of
+    # rescanning every cell until a fixed point.
+    dependents: dict[str, list[str]] = {}
+    for cell in d.cells:
+        if cell.parent:
+            dependents.setdefault(cell.parent, []).append(cell.id)
+        if cell.source:
+            dependents.setdefault(cell.source, []).append(cell.id)
+        if cell.target and cell.target != cell.source:
+            dependents.setdefault(cell.target, []).append(cell.id)
+    queue = deque(to_delete)
+    while queue:
+        cid = queue.popleft()
+        for dep in dependents.get(cid, ()):
+            if dep not in to_delete:
+                to_delete.add(dep)
+                queue.append(dep)
+    # Compact the survivors in place (order preserved) instead of
+    # rebuilding the whole list for what is usually a small deletion.
+    cells = d.cells
+    original = len(cells)
+    w = 0
+    for c in cells:
+        if c.id not in to_delete:
+            cells[w] = c
+            w += 1
+    del cells[w:]
+    d.reindex_cells()
+    return f"Removed {original - w} cell(s)."
+
+
+def _draw_add_title(d: Diagram, *, title: str, subtitle: str, **_: Any) -> str:
+    try:
+        validate_non_empty_string(title, "title")
+    except ValidationError as exc:
+        return _err(exc)
+    title_style = _TITLE_STYLE
+    ids = []
+    tid = d.add_vertex(title, 50, 10, 400, 30, title_style)
+    ids.append(tid)
+    if subtitle:
+        sub_style = _SUBTITLE_STYLE
+        sid = d.add_vertex(subtitle, 50, 42, 400, 20, sub_style)
+        ids.append(sid)
+    return _dumps(ids)
+
+
+def _draw_add_legend(
+    d: Diagram, *, legend_entries: list[dict[str, str]] | None,
+    legend_x: float, legend_y: float, legend_title: str, **_: Any,
+) -> str:
+    entries = legend_entries or []
+    try:
+        validate_list(entries, "legend_entries", min_length=1)
+        for i, entry in enumerate(entries):
+            validate_legend_entry(entry, i)
+        validate_number(legend_x, "legend_x")
+        validate_number(legend_y, "legend_y")
+    except ValidationError as exc:
+        return _err(exc)
+    entry_h = 26
+    legend_h = 26 + len(entries) * entry_h
+    lid = d.add_group(legend_title, legend_x, legend_y, 200, legend_h,
+                      _LEGEND_CONTAINER_STYLE)
+    item_ids = d.reserve_ids(len(entries))
+    d.cells.extend(
+        MxCell(
+            id=item_ids[i], value=entry["label"],
+            style=_LEGEND_ITEM_STYLE_FMT.format(
+                entry.get("fill_color", "#f5f5f5"),
+                entry.get("stroke_color", "#666666"),
+            ),
+            parent=lid, vertex=True,
+            geometry=Geometry(x=0, y=26 + i * entry_h, width=200, height=entry_h),
+        )
+        for i, entry in enumerate(entries)
+    )
+    d.reindex_cells()
+    return lid
+
+
+def _draw_build_dag(
+    d: Diagram, *, edges: list[dict[str, Any]] | None,
+    node_styles: dict[str, str] | None, edge_style_preset: str, theme: str,
+    title: str, subtitle: str, direction: str, rank_spacing: float,
+    node_spacing: float, **_: Any,
+) -> str:
+    edge_list = edges or []
+    try:
+        validate_list(edge_list, "edges", min_length=1)
+        for i, e in enumerate(edge_list):
+            validate_dag_edge_dict(e, i)
+        validate_direction(direction)
+        validate_spacing(rank_spacing, "rank_spacing")
+        validate_spacing(node_spacing, "node_spacing")
+        if node_styles:
+            validate_node_styles(node_styles)
+    except ValidationError as exc:
+        return _err(exc)
+    edge_tuples = [(e["source"], e["target"], e.get("label", "")) for e in edge_list]
+
+    resolved_styles: dict[str, str] | None = None
+    if node_styles:
+        resolved_styles = {lbl: _resolve_vertex_style(p) for lbl, p in node_styles.items()}
+
+    from drawio_mcp.layout_engine import (
+        LayoutEngineConfig,
+        ensure_page_margins,
+        layout_sugiyama,
+    )
+
+    e_style = _resolve_edge_style(edge_style_preset)
+    cfg = LayoutEngineConfig(
+        rank_spacing=rank_spacing, node_spacing=node_spacing,
+        grid_size=d.grid_size, route_edges=True,
+    )
+
+    mapping = layout_sugiyama(d, edge_tuples, node_styles=resolved_styles,
+                              edge_style=e_style, config=cfg, direction=direction)
+
+    # Auto-improve: ensure content respects page margins
+    ensure_page_margins(d, margin=40)
+
+    themed = _apply_theme_impl(d, theme)
+
+    title_ids: list[str] = []
+    if title:
+        title_style = _TITLE_STYLE
+        tid = d.add_vertex(title, 50, 10, 400, 30, title_style)
+        title_ids.append(tid)
+        if subtitle:
+            sub_style = _SUBTITLE_STYLE
+            sid = d.add_vertex(subtitle, 50, 42, 400, 20, sub_style)
+            title_ids.append(sid)
+
+    # layout_sugiyama builds the mapping fresh for this call, so append the
+    # bookkeeping keys in place instead of copying the whole dict.
+    n_nodes = len(mapping)
+    mapping["__title_ids"] = title_ids
+    mapping["__summary"] = (
+        f"{n_nodes} nodes, {len(edge_tuples)} edges, "
+        f"direction={direction}, {themed} cells themed"
+    )
+    return _dumps(mapping)
+
+
+def _draw_build_full(
+    d: Diagram, *, vertices: list[dict[str, Any]] | None,
+    edges: list[dict[str, Any]] | None, theme: str, title: str,
+    subtitle: str, **_: Any,
+) -> str:
+    verts = vertices or []
+    edge_list = edges or []
+    try:
+        validate_list(verts, "vertices", min_length=1)
+        for i, v in enumerate(verts):
+            validate_vertex_dict(v, i)
+        for i, e in enumerate(edge_list):
+            validate_edge_dict(e, i)
+    except ValidationError as exc:
+        return _err(exc)
+
+    # Create vertices
+    vertex_ids: list[str] = []
+    gs = d.grid_size
+    for v in verts:
+        s = v.get("custom_style") or _resolve_vertex_style(v.get("style_preset", ""))
+        pid = v.get("parent_id", "1")
+        vw, vh = _estimate_size(v["label"], v.get("width", 120), v.get("height", 60))
+        gx = round(v["x"] / gs) * gs
+        gy = round(v["y"] / gs) * gs
+        rx, ry = _abs_to_relative(d, gx, gy, pid)
+        cid = d.add_vertex(v["label"], rx, ry, vw, vh, s, pid, v.get("cell_id") or None)
+        vertex_ids.append(cid)
+
+    # Create edges with smart ports
+    edge_ids: list[str] = []
+    bounds = get_all_vertex_bounds(d)
+    parents = _parent_map(d)
+    for e in edge_list:
+        src_id = e["source_id"]
+        tgt_id = e["target_id"]
+        s = _resolve_edge_style(e.get("style_preset", ""))
+        ep = _common_parent(parents, src_id, tgt_id)
+        cid = d.add_edge(src_id, tgt_id, e.get("label", ""), s, ep)
+        src_b = bounds.get(src_id)
+        tgt_b = bounds.get(tgt_id)
+        if src_b and tgt_b:
+            (ex, ey), (enx, eny) = choose_best_ports(src_b, tgt_b)
+            edge_cell = _find_cell(d, cid)
+            if edge_cell:
+                edge_cell.exit_x = ex
+                edge_cell.exit_y = ey
+                edge_cell.entry_x = enx
+                edge_cell.entry_y = eny
+        edge_ids.append(cid)
+
+    from drawio_mcp.layout_engine import (
+        align_column_centers,
+        align_rank_baselines,
+        ensure_page_margins,
+        equalize_connected_sizes,
+        resolve_overlaps,
+        route_edges_around_obstacles,
+    )
+
+    # Routing only touches edge waypoints, so the port-resolution snapshot
+    # is still valid here.
+    route_edges_around_obstacles(d, margin=15, bounds=bounds)
+    resolve_overlaps(d, margin=20)
+
+    # Auto-improve: align baselines, equalize sizes, enforce margins.
+    # One fresh snapshot is shared by all four passes — each keeps the
+    # top-level entries it moves or resizes consistent in place.
+    bounds = get_all_vertex_bounds(d)
+    align_rank_baselines(d, threshold=20, bounds=bounds)
+    align_column_centers(d, threshold=20, bounds=bounds)
+    equalize_connected_sizes(d, direction="TB", bounds=bounds)
+    ensure_page_margins(d, margin=40, bounds=bounds)
+
+    themed = _apply_theme_impl(d, theme)
+
+    title_ids = []
+    if title:
+        title_style = _TITLE_STYLE
+        tid = d.add_vertex(title, 50, 10, 400, 30, title_style)
+        title_ids.append(tid)
+        if subtitle:
+            sub_style = _SUBTITLE_STYLE
+            sid = d.add_vertex(subtitle, 50, 42, 400, 20, sub_style)
+            title_ids.append(sid)
+
+    return _dumps({
+        "vertex_ids": vertex_ids, "edge_ids": edge_ids,
+        "title_ids": title_ids,
+        "summary": f"{len(vertex_ids)} vertices, {len(edge_ids)} edges, {themed} themed",
+    })
+
+
+_DRAW_HANDLERS: dict[str, Callable[..., str]] = {
+    "add_vertices": _draw_add_vertices,
+    "add_edges": _draw_add_edges,
+    "add_group": _draw_add_group,
+    "update_cells": _draw_update_cells,
+    "delete_cells": _draw_delete_cells,
+    "add_title": _draw_add_title,
+    "add_legend": _draw_add_legend,
+    "build_dag": _draw_build_dag,
+    "build_full": _draw_build_full,
+}
 
 
 # ===================================================================
@@ -668,360 +1275,36 @@ def draw(
         action = validate_action(action, "draw", _DRAW_ACTIONS)
         validate_non_empty_string(diagram_name, "diagram_name")
     except ValidationError as exc:
-        return f"Error: {exc.message}"
-    df = _diagrams.get(diagram_name)
+        return _err(exc)
+    df = _lookup_diagram(diagram_name)
     if not df:
         return f"Error: diagram '{diagram_name}' not found."
+    # Every action below may mutate the document.
+    df.invalidate_xml_cache()
     try:
         validate_page_index(page_index, len(df.diagrams))
     except ValidationError as exc:
-        return f"Error: {exc.message}"
+        return _err(exc)
     d = df.diagrams[page_index]
 
-    # ----- add_vertices -----
-    if action == "add_vertices":
-        verts = vertices or []
-        try:
-            validate_list(verts, "vertices", min_length=1)
-            for i, v in enumerate(verts):
-                validate_vertex_dict(v, i)
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        ids: list[str] = []
-        for i, v in enumerate(verts):
-            vstyle = v.get("custom_style") or _resolve_vertex_style(v.get("style_preset", ""))
-            pid = v.get("parent_id", "1")
-            vw, vh = _estimate_size(v["label"], v.get("width", 120), v.get("height", 60))
-            gx = snap_to_grid(v["x"], d.grid_size)
-            gy = snap_to_grid(v["y"], d.grid_size)
-            rx, ry = _abs_to_relative(d, gx, gy, pid)
-            cid = d.add_vertex(v["label"], rx, ry, vw, vh, vstyle, pid, v.get("cell_id") or None)
-            # Apply metadata if provided
-            cell = _find_cell(d, cid)
-            if cell:
-                if v.get("tooltip"):
-                    cell.tooltip = v["tooltip"]
-                if v.get("link"):
-                    cell.link = v["link"]
-                if v.get("metadata") and isinstance(v["metadata"], dict):
-                    cell.metadata = v["metadata"]
-            ids.append(cid)
-        return json.dumps(ids)
-
-    # ----- add_edges -----
-    elif action == "add_edges":
-        edge_list = edges or []
-        try:
-            validate_list(edge_list, "edges", min_length=1)
-            for i, e in enumerate(edge_list):
-                validate_edge_dict(e, i)
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        ids = []
-        bounds = get_all_vertex_bounds(d)
-        auto_pairs: list[tuple[str, str]] = []
-        auto_indices: list[int] = []
-        explicit_ports: dict[int, tuple[str, str]] = {}
-
-        for i, e in enumerate(edge_list):
-            ep_exit = e.get("exit_port", "")
-            ep_entry = e.get("entry_port", "")
-            if ep_exit or ep_entry:
-                explicit_ports[i] = (ep_exit, ep_entry)
-            else:
-                auto_indices.append(i)
-                auto_pairs.append((e["source_id"], e["target_id"]))
-
-        batch_ports = distribute_ports_for_batch(auto_pairs, bounds) if auto_pairs else []
-
-        for i, e in enumerate(edge_list):
-            src_id = e["source_id"]
-            tgt_id = e["target_id"]
-            estyle = e.get("custom_style") or _resolve_edge_style(e.get("style_preset", ""))
-            ep = e.get("parent_id", "")
-            if not ep or ep == "1":
-                ep = _find_common_parent(d, src_id, tgt_id)
-
-            cid = d.add_edge(src_id, tgt_id, e.get("label", ""), estyle, ep)
-
-            # Port resolution
-            edge_cell = _find_cell(d, cid)
-            if edge_cell:
-                if i in explicit_ports:
-                    exit_name, entry_name = explicit_ports[i]
-                    ex, ey, enx, eny = _resolve_ports(d, src_id, tgt_id, exit_name, entry_name, False)
-                else:
-                    batch_idx = auto_indices.index(i) if i in auto_indices else -1
-                    if batch_idx >= 0 and batch_idx < len(batch_ports):
-                        (ex, ey), (enx, eny) = batch_ports[batch_idx]
-                    else:
-                        ex, ey, enx, eny = _resolve_ports(d, src_id, tgt_id, "", "", True)
-                if ex is not None:
-                    edge_cell.exit_x = ex
-                    edge_cell.exit_y = ey
-                if enx is not None:
-                    edge_cell.entry_x = enx
-                    edge_cell.entry_y = eny
-            ids.append(cid)
-
-        # Route edges around obstacles
-        route_edges_around_obstacles(d, margin=15)
-        return json.dumps(ids)
-
-    # ----- add_group -----
-    elif action == "add_group":
-        try:
-            validate_non_empty_string(group_label, "group_label")
-            validate_number(group_x, "group_x")
-            validate_number(group_y, "group_y")
-            validate_positive_number(group_width, "group_width")
-            validate_positive_number(group_height, "group_height")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        gstyle = group_custom_style or _resolve_vertex_style(group_style_preset)
-        gx = snap_to_grid(group_x, d.grid_size)
-        gy = snap_to_grid(group_y, d.grid_size)
-        rx, ry = _abs_to_relative(d, gx, gy, group_parent_id)
-        cid = d.add_group(group_label, rx, ry, group_width, group_height, gstyle, group_parent_id)
-        return cid
-
-    # ----- update_cells -----
-    elif action == "update_cells":
-        upd_list = updates or []
-        try:
-            validate_list(upd_list, "updates", min_length=1)
-            for i, u in enumerate(upd_list):
-                validate_update_dict(u, i)
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        results: list[str] = []
-        for u in upd_list:
-            cell = _find_cell(d, u["cell_id"])
-            if not cell:
-                results.append(f"not_found:{u['cell_id']}")
-                continue
-            if "label" in u:
-                cell.value = u["label"]
-            if "style" in u:
-                cell.style = u["style"]
-            if cell.geometry:
-                if "x" in u:
-                    cell.geometry.x = snap_to_grid(u["x"], d.grid_size)
-                if "y" in u:
-                    cell.geometry.y = snap_to_grid(u["y"], d.grid_size)
-                if "width" in u:
-                    cell.geometry.width = u["width"]
-                if "height" in u:
-                    cell.geometry.height = u["height"]
-            results.append(f"ok:{u['cell_id']}")
-        return json.dumps(results)
-
-    # ----- delete_cells -----
-    elif action == "delete_cells":
-        try:
-            validate_list(cell_ids or [], "cell_ids", min_length=1)
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        to_delete = set(cell_ids or [])
-        changed = True
-        while changed:
-            changed = False
-            for cell in d.cells:
-                if cell.id in to_delete:
-                    continue
-                if cell.parent in to_delete:
-                    to_delete.add(cell.id)
-                    changed = True
-                if cell.source in to_delete or cell.target in to_delete:
-                    to_delete.add(cell.id)
-                    changed = True
-        original = len(d.cells)
-        d.cells = [c for c in d.cells if c.id not in to_delete]
-        return f"Removed {original - len(d.cells)} cell(s)."
-
-    # ----- add_title -----
-    elif action == "add_title":
-        try:
-            validate_non_empty_string(title, "title")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        title_style = _resolve_vertex_style("TITLE")
-        ids = []
-        tid = d.add_vertex(title, 50, 10, 400, 30, title_style)
-        ids.append(tid)
-        if subtitle:
-            sub_style = _resolve_vertex_style("SUBTITLE")
-            sid = d.add_vertex(subtitle, 50, 42, 400, 20, sub_style)
-            ids.append(sid)
-        return json.dumps(ids)
-
-    # ----- add_legend -----
-    elif action == "add_legend":
-        entries = legend_entries or []
-        try:
-            validate_list(entries, "legend_entries", min_length=1)
-            for i, entry in enumerate(entries):
-                validate_legend_entry(entry, i)
-            validate_number(legend_x, "legend_x")
-            validate_number(legend_y, "legend_y")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        entry_h = 26
-        legend_h = 26 + len(entries) * entry_h
-        legend_style = (
-            "swimlane;fontStyle=1;childLayout=stackLayout;horizontal=1;"
-            "startSize=26;fillColor=#ffffff;horizontalStack=0;"
-            "resizeParent=1;resizeParentMax=0;resizeLast=0;collapsible=0;"
-            "marginBottom=0;strokeColor=#666666;html=1;"
-        )
-        lid = d.add_group(legend_title, legend_x, legend_y, 200, legend_h, legend_style)
-        for i, entry in enumerate(entries):
-            fill = entry.get("fill_color", "#f5f5f5")
-            stroke = entry.get("stroke_color", "#666666")
-            item_style = (
-                f"text;align=left;verticalAlign=top;spacingLeft=4;spacingRight=4;"
-                f"overflow=hidden;rotatable=0;points=[[0,0.5],[1,0.5]];"
-                f"portConstraint=eastwest;fillColor={fill};strokeColor={stroke};html=1;"
-            )
-            cell = MxCell(
-                id=d.next_id(), value=entry["label"], style=item_style,
-                parent=lid, vertex=True,
-                geometry=Geometry(x=0, y=26 + i * entry_h, width=200, height=entry_h),
-            )
-            d.cells.append(cell)
-        return lid
-
-    # ----- build_dag -----
-    elif action == "build_dag":
-        edge_list = edges or []
-        try:
-            validate_list(edge_list, "edges", min_length=1)
-            for i, e in enumerate(edge_list):
-                validate_dag_edge_dict(e, i)
-            validate_direction(direction)
-            validate_spacing(rank_spacing, "rank_spacing")
-            validate_spacing(node_spacing, "node_spacing")
-            if node_styles:
-                validate_node_styles(node_styles)
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        edge_tuples = [(e["source"], e["target"], e.get("label", "")) for e in edge_list]
-
-        resolved_styles: dict[str, str] | None = None
-        if node_styles:
-            resolved_styles = {lbl: _resolve_vertex_style(p) for lbl, p in node_styles.items()}
-
-        e_style = _resolve_edge_style(edge_style_preset)
-        cfg = LayoutEngineConfig(
-            rank_spacing=rank_spacing, node_spacing=node_spacing,
-            grid_size=d.grid_size, route_edges=True,
-        )
-
-        mapping = layout_sugiyama(d, edge_tuples, node_styles=resolved_styles,
-                                  edge_style=e_style, config=cfg, direction=direction)
-
-        # Auto-improve: ensure content respects page margins
-        ensure_page_margins(d, margin=40)
-
-        themed = _apply_theme_impl(d, theme)
-
-        title_ids: list[str] = []
-        if title:
-            title_style = _resolve_vertex_style("TITLE")
-            tid = d.add_vertex(title, 50, 10, 400, 30, title_style)
-            title_ids.append(tid)
-            if subtitle:
-                sub_style = _resolve_vertex_style("SUBTITLE")
-                sid = d.add_vertex(subtitle, 50, 42, 400, 20, sub_style)
-                title_ids.append(sid)
-
-        result_map = dict(mapping)
-        result_map["__title_ids"] = title_ids
-        result_map["__summary"] = (
-            f"{len(mapping)} nodes, {len(edge_tuples)} edges, "
-            f"direction={direction}, {themed} cells themed"
-        )
-        return json.dumps(result_map)
-
-    # ----- build_full -----
-    elif action == "build_full":
-        verts = vertices or []
-        edge_list = edges or []
-        try:
-            validate_list(verts, "vertices", min_length=1)
-            for i, v in enumerate(verts):
-                validate_vertex_dict(v, i)
-            for i, e in enumerate(edge_list):
-                validate_edge_dict(e, i)
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-
-        # Create vertices
-        vertex_ids: list[str] = []
-        for v in verts:
-            s = v.get("custom_style") or _resolve_vertex_style(v.get("style_preset", ""))
-            pid = v.get("parent_id", "1")
-            vw, vh = _estimate_size(v["label"], v.get("width", 120), v.get("height", 60))
-            gx = snap_to_grid(v["x"], d.grid_size)
-            gy = snap_to_grid(v["y"], d.grid_size)
-            rx, ry = _abs_to_relative(d, gx, gy, pid)
-            cid = d.add_vertex(v["label"], rx, ry, vw, vh, s, pid, v.get("cell_id") or None)
-            vertex_ids.append(cid)
-
-        # Create edges with smart ports
-        edge_ids: list[str] = []
-        bounds = get_all_vertex_bounds(d)
-        for e in edge_list:
-            src_id = e["source_id"]
-            tgt_id = e["target_id"]
-            s = _resolve_edge_style(e.get("style_preset", ""))
-            ep = _find_common_parent(d, src_id, tgt_id)
-            cid = d.add_edge(src_id, tgt_id, e.get("label", ""), s, ep)
-            src_b = bounds.get(src_id)
-            tgt_b = bounds.get(tgt_id)
-            if src_b and tgt_b:
-                (ex, ey), (enx, eny) = choose_best_ports(src_b, tgt_b)
-                edge_cell = _find_cell(d, cid)
-                if edge_cell:
-                    edge_cell.exit_x = ex
-                    edge_cell.exit_y = ey
-                    edge_cell.entry_x = enx
-                    edge_cell.entry_y = eny
-            edge_ids.append(cid)
-
-        route_edges_around_obstacles(d, margin=15)
-        resolve_overlaps(d, margin=20)
-
-        # Auto-improve: align baselines, equalize sizes, enforce margins
-        align_rank_baselines(d, threshold=20)
-        align_column_centers(d, threshold=20)
-        equalize_connected_sizes(d, direction="TB")
-        ensure_page_margins(d, margin=40)
-
-        themed = _apply_theme_impl(d, theme)
-
-        title_ids = []
-        if title:
-            title_style = _resolve_vertex_style("TITLE")
-            tid = d.add_vertex(title, 50, 10, 400, 30, title_style)
-            title_ids.append(tid)
-            if subtitle:
-                sub_style = _resolve_vertex_style("SUBTITLE")
-                sid = d.add_vertex(subtitle, 50, 42, 400, 20, sub_style)
-                title_ids.append(sid)
-
-        return json.dumps({
-            "vertex_ids": vertex_ids, "edge_ids": edge_ids,
-            "title_ids": title_ids,
-            "summary": f"{len(vertex_ids)} vertices, {len(edge_ids)} edges, {themed} themed",
-        })
-
-    else:
+    handler = _DRAW_HANDLERS.get(action)
+    if handler is None:
         return (
             f"Error: unknown draw action '{action}'. "
             "Use: add_vertices, add_edges, add_group, update_cells, delete_cells, "
             "add_title, add_legend, build_dag, build_full."
         )
+    return handler(
+        d, vertices=vertices, edges=edges, updates=updates, cell_ids=cell_ids,
+        title=title, subtitle=subtitle, legend_entries=legend_entries,
+        group_label=group_label, group_x=group_x, group_y=group_y,
+        group_width=group_width, group_height=group_height,
+        group_style_preset=group_style_preset, group_custom_style=group_custom_style,
+        group_parent_id=group_parent_id, node_styles=node_styles,
+        edge_style_preset=edge_style_preset, direction=direction,
+        rank_spacing=rank_spacing, node_spacing=node_spacing, theme=theme,
+        legend_x=legend_x, legend_y=legend_y, legend_title=legend_title,
+    )
 
 
 # ===================================================================
@@ -1099,7 +1382,7 @@ def style(
     try:
         action = validate_action(action, "style", _STYLE_ACTIONS)
     except ValidationError as exc:
-        return f"Error: {exc.message}"
+        return _err(exc)
 
     if action == "build":
         try:
@@ -1116,7 +1399,7 @@ def style(
             if extra:
                 validate_extra_dict(extra)
         except ValidationError as exc:
-            return f"Error: {exc.message}"
+            return _err(exc)
         sb = StyleBuilder(base)
         if theme:
             t = getattr(Themes, theme.upper(), None)
@@ -1156,63 +1439,55 @@ def style(
             validate_non_empty_string(diagram_name, "diagram_name")
             validate_non_empty_string(theme, "theme")
         except ValidationError as exc:
-            return f"Error: {exc.message}"
-        df = _diagrams.get(diagram_name)
+            return _err(exc)
+        df = _lookup_diagram(diagram_name)
         if not df:
             return f"Error: diagram '{diagram_name}' not found."
+        df.invalidate_xml_cache()
         try:
             validate_page_index(page_index, len(df.diagrams))
         except ValidationError as exc:
-            return f"Error: {exc.message}"
+            return _err(exc)
         t = getattr(Themes, theme.upper(), None)
         if not isinstance(t, ColorTheme):
             return f"Error: unknown theme '{theme}'."
         d = df.diagrams[page_index]
         count = 0
+        id_filter = set(cell_ids) if cell_ids else None
+        probes = _theme_probes(t)
+        t_apply = t.apply
+        themed_cache: dict[str, str] = {}
         for cell in d.cells:
-            if cell.id in ("0", "1"):
+            if cell.id in _STRUCTURAL_IDS:
                 continue
-            if cell_ids and cell.id not in cell_ids:
+            if id_filter is not None and cell.id not in id_filter:
                 continue
             if skip_edges and cell.edge:
                 continue
-            if not cell.style:
+            style = cell.style
+            if not style:
                 continue
-            sb = StyleBuilder(cell.style)
-            t.apply(sb)
-            cell.style = sb.build()
+            themed_style = themed_cache.get(style)
+            if themed_style is None:
+                if all(p in style for p in probes):
+                    themed_style = style
+                else:
+                    sb = StyleBuilder(style)
+                    t_apply(sb)
+                    themed_style = sb.build()
+                themed_cache[style] = themed_style
+            cell.style = themed_style
             count += 1
         return f"Applied theme '{theme}' to {count} cell(s)."
 
     elif action == "list_vertex_presets":
-        entries: list[str] = []
-        for name in sorted(dir(VertexStyle)):
-            if name.startswith("_"):
-                continue
-            val = getattr(VertexStyle, name)
-            if isinstance(val, str):
-                entries.append(f"  {name}: {val}")
-        return "Vertex style presets:\n" + "\n".join(entries)
+        return _VERTEX_PRESETS_STR
 
     elif action == "list_edge_presets":
-        entries = []
-        for name in sorted(dir(EdgeStylePreset)):
-            if name.startswith("_"):
-                continue
-            val = getattr(EdgeStylePreset, name)
-            if isinstance(val, str):
-                entries.append(f"  {name}: {val}")
-        return "Edge style presets:\n" + "\n".join(entries)
+        return _EDGE_PRESETS_STR
 
     elif action == "list_themes":
-        entries = []
-        for name in sorted(dir(Themes)):
-            if name.startswith("_"):
-                continue
-            val = getattr(Themes, name)
-            if isinstance(val, ColorTheme):
-                entries.append(f"  {name}: fill={val.fill} stroke={val.stroke} font={val.font}")
-        return "Color themes:\n" + "\n".join(entries)
+        return _THEMES_STR
 
     else:
         return (
@@ -1221,10 +1496,581 @@ def style(
         )
 
 
+def _layout_sugiyama(
+    d: Diagram, *, connections: list[dict[str, str]] | None, direction: str,
+    rank_spacing: float, node_spacing: float, edge_style_preset: str, **_: Any,
+) -> str:
+    from drawio_mcp.layout_engine import (
+        LayoutEngineConfig,
+        layout_sugiyama,
+    )
+
+    conns = connections or []
+    try:
+        validate_list(conns, "connections", min_length=1)
+        # The validator returns the normalized (source, target, label)
+        # triple, so the edge tuples fall out of the validation pass.
+        edge_tuples = [validate_connection_dict(c, i) for i, c in enumerate(conns)]
+        validate_direction(direction)
+        validate_spacing(rank_spacing, "rank_spacing")
+        validate_spacing(node_spacing, "node_spacing")
+    except ValidationError as exc:
+        return _err(exc)
+    e_style = _resolve_edge_style(edge_style_preset)
+    cfg = LayoutEngineConfig(
+        rank_spacing=rank_spacing, node_spacing=node_spacing,
+        grid_size=d.grid_size, route_edges=True,
+    )
+    mapping = layout_sugiyama(d, edge_tuples, edge_style=e_style,
+                              config=cfg, direction=direction)
+    return _dumps(mapping)
+
+
+def _layout_tree(
+    d: Diagram, *, adjacency: dict[str, list[str]] | None, root: str, direction: str,
+    h_spacing: float, v_spacing: float, width: float, height: float,
+    style_preset: str, custom_style: str, edge_style_preset: str,
+    custom_edge_style: str, **_: Any,
+) -> str:
+    try:
+        validate_adjacency(adjacency)
+        validate_non_empty_string(root, "root")
+        validate_direction(direction)
+        validate_spacing(h_spacing, "h_spacing")
+        validate_spacing(v_spacing, "v_spacing")
+        validate_positive_number(width, "width")
+        validate_positive_number(height, "height")
+    except ValidationError as exc:
+        return _err(exc)
+    adj = adjacency or {}
+    vs = custom_style or _resolve_vertex_style(style_preset)
+    es = custom_edge_style or _resolve_edge_style(edge_style_preset)
+    cfg = LayoutConfig(h_spacing=h_spacing, v_spacing=v_spacing,
+                       default_width=width, default_height=height)
+    mapping = layout_tree(d, adj, root, vs, es, cfg, direction)
+    return _dumps(mapping)
+
+
+def _layout_horizontal(
+    d: Diagram, *, labels: list[str] | None, style_preset: str, custom_style: str,
+    edge_style_preset: str, edge_labels: list[str] | None, connect: bool,
+    start_x: float, start_y: float, h_spacing: float, width: float,
+    height: float, **_: Any,
+) -> str:
+    lbl_list = labels or []
+    try:
+        validate_list(lbl_list, "labels", min_length=1)
+        validate_spacing(h_spacing, "h_spacing")
+        validate_positive_number(width, "width")
+        validate_positive_number(height, "height")
+    except ValidationError as exc:
+        return _err(exc)
+    vs = custom_style or _resolve_vertex_style(style_preset)
+    cfg = LayoutConfig(start_x=start_x, start_y=start_y, h_spacing=h_spacing,
+                       default_width=width, default_height=height)
+    ids = layout_horizontal(d, lbl_list, vs, cfg)
+    edge_ids: list[str] = []
+    if connect and len(ids) > 1:
+        es = _resolve_edge_style(edge_style_preset)
+        edge_ids = connect_chain(d, ids, es, edge_labels)
+    return _dumps({"vertex_ids": ids, "edge_ids": edge_ids})
+
+
+def _layout_vertical(
+    d: Diagram, *, labels: list[str] | None, style_preset: str, custom_style: str,
+    edge_style_preset: str, edge_labels: list[str] | None, connect: bool,
+    start_x: float, start_y: float, v_spacing: float, width: float,
+    height: float, **_: Any,
+) -> str:
+    lbl_list = labels or []
+    try:
+        validate_list(lbl_list, "labels", min_length=1)
+        validate_spacing(v_spacing, "v_spacing")
+        validate_positive_number(width, "width")
+        validate_positive_number(height, "height")
+    except ValidationError as exc:
+        return _err(exc)
+    vs = custom_style or _resolve_vertex_style(style_preset)
+    cfg = LayoutConfig(start_x=start_x, start_y=start_y, v_spacing=v_spacing,
+                       default_width=width, default_height=height)
+    ids = layout_vertical(d, lbl_list, vs, cfg)
+    edge_ids = []
+    if connect and len(ids) > 1:
+        es = _resolve_edge_style(edge_style_preset)
+        edge_ids = connect_chain(d, ids, es, edge_labels)
+    return _dumps({"vertex_ids": ids, "edge_ids": edge_ids})
+
+
+def _layout_grid(
+    d: Diagram, *, labels: list[str] | None, columns: int, style_preset: str,
+    custom_style: str, start_x: float, start_y: float, h_spacing: float,
+    v_spacing: float, width: float, height: float, **_: Any,
+) -> str:
+    lbl_list = labels or []
+    try:
+        validate_list(lbl_list, "labels", min_length=1)
+        validate_columns(columns)
+        validate_spacing(h_spacing, "h_spacing")
+        validate_spacing(v_spacing, "v_spacing")
+        validate_positive_number(width, "width")
+        validate_positive_number(height, "height")
+    except ValidationError as exc:
+        return _err(exc)
+    vs = custom_style or _resolve_vertex_style(style_preset)
+    cfg = LayoutConfig(start_x=start_x, start_y=start_y,
+                       h_spacing=h_spacing, v_spacing=v_spacing,
+                       default_width=width, default_height=height)
+    ids = layout_grid(d, lbl_list, columns, vs, cfg)
+    return _dumps(ids)
+
+
+def _layout_flowchart(
+    d: Diagram, *, steps: list[dict[str, str]] | None, direction: str, **_: Any,
+) -> str:
+    step_list = steps or []
+    try:
+        validate_list(step_list, "steps", min_length=1)
+        for i, step in enumerate(step_list):
+            validate_flowchart_step(step, i)
+        validate_direction(direction)
+    except ValidationError as exc:
+        return _err(exc)
+    spacing = 80
+    ids = []
+    for i, step in enumerate(step_list):
+        stype = step.get("type", "process").lower()
+        s = _FLOWCHART_TYPE_MAP.get(stype, VertexStyle.FLOWCHART_PROCESS)
+        w, h = _FLOWCHART_SIZES.get(stype, _FLOWCHART_DEFAULT_SIZE)
+        if direction == "LR":
+            x, y = 50 + i * (w + spacing), 50
+        else:
+            x, y = 50, 50 + i * (h + spacing)
+        cid = d.add_vertex(step["label"], x, y, w, h, s)
+        ids.append(cid)
+    edge_ids = connect_chain(d, ids, _FLOWCHART_EDGE_STYLE)
+    return _dumps({"vertex_ids": ids, "edge_ids": edge_ids})
+
+
+def _layout_smart_connect(
+    d: Diagram, *, connections: list[dict[str, str]] | None, edge_style_preset: str, **_: Any,
+) -> str:
+    from drawio_mcp.layout_engine import route_edges_around_obstacles
+
+    conns = connections or []
+    try:
+        validate_list(conns, "connections", min_length=1)
+        for i, conn in enumerate(conns):
+            validate_connection_dict(conn, i)
+    except ValidationError as exc:
+        return _err(exc)
+    s = _resolve_edge_style(edge_style_preset if edge_style_preset and edge_style_preset != "DEFAULT" else "DEFAULT")
+    bounds = get_all_vertex_bounds(d)
+    auto_pairs: list[tuple[str, str]] = []
+    explicit: dict[int, tuple[str, str]] = {}
+
+    for i, conn in enumerate(conns):
+        ep_exit = conn.get("exit_port", "")
+        ep_entry = conn.get("entry_port", "")
+        if ep_exit or ep_entry:
+            explicit[i] = (ep_exit, ep_entry)
+        else:
+            auto_pairs.append((conn["source_id"], conn["target_id"]))
+
+    bp = distribute_ports_for_batch(auto_pairs, bounds) if auto_pairs else []
+    # The batch results come back in auto_pairs order, which is the
+    # original connection order with the explicit entries removed — so
+    # consuming them in lockstep needs no index bookkeeping at all.
+    bp_iter = iter(bp)
+    parents = _parent_map(d)
+    ids = []
+    for i, conn in enumerate(conns):
+        src_id = conn["source_id"]
+        tgt_id = conn["target_id"]
+        ep = _common_parent(parents, src_id, tgt_id)
+
+        if i in explicit:
+            exit_name, entry_name = explicit[i]
+            ex, ey, enx, eny = _resolve_ports(d, src_id, tgt_id, exit_name, entry_name, False)
+        else:
+            (ex, ey), (enx, eny) = next(bp_iter)
+
+        cid = d.add_edge(src_id, tgt_id, conn.get("label", ""), s, ep)
+        # The new edge is the last cell appended.
+        edge_cell = d.cells[-1]
+        if edge_cell:
+            if ex is not None:
+                edge_cell.exit_x = ex
+                edge_cell.exit_y = ey
+            if enx is not None:
+                edge_cell.entry_x = enx
+                edge_cell.entry_y = eny
+        ids.append(cid)
+
+    # Appending edges does not move vertices, so the snapshot is valid.
+    route_edges_around_obstacles(d, margin=15, bounds=bounds)
+    return _dumps(ids)
+
+
+def _layout_align(
+    d: Diagram, *, cell_ids: list[str] | None, alignment: str, **_: Any,
+) -> str:
+    try:
+        validate_list(cell_ids or [], "cell_ids", min_length=2)
+        validate_alignment(alignment)
+    except ValidationError as exc:
+        return _err(exc)
+    cell_list = cell_ids or []
+    by_id = {c.id: c for c in d.cells}
+    cells = [by_id.get(cid) for cid in cell_list]
+    cells = [c for c in cells if c and c.geometry and not c.geometry.relative]
+    if len(cells) < 2:
+        return "Need at least 2 cells to align."
+
+    al = alignment.lower()
+    # Work on the geometry objects directly and snap inline with a
+    # hoisted grid size — these loops are pure float arithmetic.
+    geos = [c.geometry for c in cells]
+    gs = d.grid_size
+    if al == "left":
+        t = min(g.x for g in geos)
+        for g in geos:
+            g.x = t
+    elif al == "center":
+        t = sum(g.x + g.width / 2 for g in geos) / len(geos)
+        for g in geos:
+            g.x = round((t - g.width / 2) / gs) * gs
+    elif al == "right":
+        t = max(g.x + g.width for g in geos)
+        for g in geos:
+            g.x = round((t - g.width) / gs) * gs
+    elif al == "top":
+        t = min(g.y for g in geos)
+        for g in geos:
+            g.y = t
+    elif al == "middle":
+        t = sum(g.y + g.height / 2 for g in geos) / len(geos)
+        for g in geos:
+            g.y = round((t - g.height / 2) / gs) * gs
+    elif al == "bottom":
+        t = max(g.y + g.height for g in geos)
+        for g in geos:
+            g.y = round((t - g.height) / gs) * gs
+    else:
+        return f"Error: unknown alignment '{al}'."
+    return f"Aligned {len(cells)} cells to '{al}'."
+
+
+def _layout_distribute(
+    d: Diagram, *, cell_ids: list[str] | None, dist_direction: str, **_: Any,
+) -> str:
+    try:
+        validate_list(cell_ids or [], "cell_ids", min_length=2)
+        validate_string(dist_direction, "dist_direction")
+    except ValidationError as exc:
+        return _err(exc)
+    cell_list = cell_ids or []
+    by_id = {c.id: c for c in d.cells}
+    cells = [by_id.get(cid) for cid in cell_list]
+    cells = [c for c in cells if c and c.geometry and not c.geometry.relative]
+    if len(cells) < 2:
+        return "Need at least 2 cells to distribute."
+    dd = dist_direction.lower()
+    gs = d.grid_size
+    # Build (position, size, geometry) triples in one comprehension and
+    # sort those, so each attribute is read exactly once; zip(*...) then
+    # unpacks the columns without further passes over the cells.
+    if dd == "horizontal":
+        triples = sorted(
+            ((c.geometry.x, c.geometry.width, c.geometry) for c in cells), key=_item0
+        )
+        positions, sizes, geos = zip(*triples)
+        end_pos = positions[-1] + sizes[-1]
+        new_pos = distribute_evenly(list(positions), list(sizes), positions[0], end_pos)
+        for g, nx in zip(geos, new_pos):
+            g.x = round(nx / gs) * gs
+    else:
+        triples = sorted(
+            ((c.geometry.y, c.geometry.height, c.geometry) for c in cells), key=_item0
+        )
+        positions, sizes, geos = zip(*triples)
+        end_pos = positions[-1] + sizes[-1]
+        new_pos = distribute_evenly(list(positions), list(sizes), positions[0], end_pos)
+        for g, ny in zip(geos, new_pos):
+            g.y = round(ny / gs) * gs
+    return f"Distributed {len(cells)} cells {dd}ly."
+
+
+def _polish_fingerprint(d: Diagram, direction: str) -> int:
+    """Hash everything the polish pipeline reads or writes.
+
+    Covers cell topology, labels, styles, positions, sizes, edge
+    waypoints, endpoint/offset points, and the requested direction — any
+    mutation between two polish calls produces a different value, so no
+    explicit invalidation is needed.
+    """
+    parts: list[object] = [direction]
+    for c in d.cells:
+        g = c.geometry
+        parts.append((
+            c.id, c.value, c.style, c.parent, c.source, c.target,
+            None if g is None else (
+                g.x, g.y, g.width, g.height,
+                tuple((p.x, p.y) for p in g.points),
+                None if g.offset is None else (g.offset.x, g.offset.y),
+                None if g.source_point is None else (g.source_point.x, g.source_point.y),
+                None if g.target_point is None else (g.target_point.x, g.target_point.y),
+            ),
+        ))
+    return hash(tuple(parts))
+
+
+def _layout_polish(
+    d: Diagram, *, direction: str, **_: Any,
+) -> str:
+    from drawio_mcp.layout_engine import (
+        LayoutEngineConfig,
+        align_column_centers,
+        align_rank_baselines,
+        center_diagram_on_page,
+        compact_diagram,
+        ensure_page_margins,
+        equalize_connected_sizes,
+        optimize_edge_paths,
+        position_edge_labels,
+        relayout_diagram,
+        resolve_overlaps,
+        route_edges_around_obstacles,
+    )
+
+    try:
+        validate_direction(direction)
+    except ValidationError as exc:
+        return _err(exc)
+    # Skip the whole pipeline when nothing has changed since the last
+    # polish of this diagram — the fingerprint is stored post-run, so a
+    # match means a re-run would start from the exact same state.
+    fp = _polish_fingerprint(d, direction)
+    if fp == d._polish_hash and d._polish_result is not None:
+        return d._polish_result
+    results: list[str] = []
+    cfg = LayoutEngineConfig(grid_size=d.grid_size)
+    moved = relayout_diagram(d, direction=direction, config=cfg)
+    results.append(f"Relayout: {len(moved)} shapes")
+    om = resolve_overlaps(d, margin=20)
+    results.append(f"Overlaps: {om} fixes")
+    cm = compact_diagram(d, margin=40)
+    results.append(f"Compact: {cm} adjusted")
+    # Auto-alignment pass — one snapshot, kept consistent in place for
+    # the top-level cells these passes move or resize.
+    bounds = get_all_vertex_bounds(d)
+    bl = align_rank_baselines(d, threshold=20, bounds=bounds)
+    cl = align_column_centers(d, threshold=20, bounds=bounds)
+    eq = equalize_connected_sizes(d, direction=direction, bounds=bounds)
+    results.append(f"Aligned: {bl} rows, {cl} cols, {eq} equalized")
+    # Fresh snapshot for the edge passes: aligning may move containers,
+    # which shifts child bounds the in-place updates don't track. The
+    # edge passes themselves only touch waypoints and label offsets.
+    bounds = get_all_vertex_bounds(d)
+    routed = route_edges_around_obstacles(d, margin=15, bounds=bounds)
+    results.append(f"Routing: {routed} edges")
+    opt = optimize_edge_paths(d, margin=15, bounds=bounds)
+    results.append(f"Optimized: {opt} edges")
+    lf = position_edge_labels(d, margin=8, bounds=bounds)
+    results.append(f"Labels: {lf} fixed")
+    # Final pass: center on page and enforce margins
+    cp = center_diagram_on_page(d, margin=50, bounds=bounds)
+    pm = ensure_page_margins(d, margin=40, bounds=bounds)
+    results.append(f"Centered: {cp}, Margins: {pm}")
+    result = "Polished! " + " | ".join(results)
+    d._polish_hash = _polish_fingerprint(d, direction)
+    d._polish_result = result
+    return result
+
+
+def _layout_relayout(
+    d: Diagram, *, direction: str, rank_spacing: float, node_spacing: float, **_: Any,
+) -> str:
+    from drawio_mcp.layout_engine import (
+        LayoutEngineConfig,
+        ensure_page_margins,
+        relayout_diagram,
+    )
+
+    try:
+        validate_direction(direction)
+        validate_spacing(rank_spacing, "rank_spacing")
+        validate_spacing(node_spacing, "node_spacing")
+    except ValidationError as exc:
+        return _err(exc)
+    cfg = LayoutEngineConfig(rank_spacing=rank_spacing, node_spacing=node_spacing,
+                             grid_size=d.grid_size)
+    moved = relayout_diagram(d, direction=direction, config=cfg)
+    ensure_page_margins(d, margin=40)
+    return f"Repositioned {len(moved)} shape(s)."
+
+
+def _layout_compact(
+    d: Diagram, *, margin: float, **_: Any,
+) -> str:
+    from drawio_mcp.layout_engine import compact_diagram
+
+    try:
+        validate_non_negative_number(margin, "margin")
+    except ValidationError as exc:
+        return _err(exc)
+    count = compact_diagram(d, margin=margin)
+    return f"Compacted: {count} shape(s) adjusted."
+
+
+def _layout_reroute_edges(
+    d: Diagram, *, margin: float, **_: Any,
+) -> str:
+    from drawio_mcp.layout_engine import route_edges_around_obstacles
+
+    try:
+        validate_non_negative_number(margin, "margin")
+    except ValidationError as exc:
+        return _err(exc)
+    # Nothing to route without edges — skip the obstacle-bounds build.
+    if not any(c.edge for c in d.cells):
+        return "Rerouted 0 edge(s)."
+    count = route_edges_around_obstacles(d, margin=margin)
+    return f"Rerouted {count} edge(s)."
+
+
+def _layout_resolve_overlaps(
+    d: Diagram, *, margin: float, **_: Any,
+) -> str:
+    from drawio_mcp.layout_engine import (
+        find_overlapping_cells,
+        resolve_overlaps,
+    )
+
+    try:
+        validate_non_negative_number(margin, "margin")
+    except ValidationError as exc:
+        return _err(exc)
+    # Fewer than two vertices cannot overlap — skip the scans outright.
+    vcount = 0
+    for c in d.cells:
+        if c.vertex:
+            vcount += 1
+            if vcount == 2:
+                break
+    if vcount < 2:
+        return "No overlaps found. Diagram is clean!"
+    before = find_overlapping_cells(d, margin=0)
+    if not before:
+        return "No overlaps found. Diagram is clean!"
+    moves = resolve_overlaps(d, margin=margin)
+    after = find_overlapping_cells(d, margin=0)
+    return f"Found {len(before)} overlaps. {moves} adjustments. Remaining: {len(after)}."
+
+
+def _layout_fix_labels(
+    d: Diagram, *, margin: float, **_: Any,
+) -> str:
+    from drawio_mcp.layout_engine import position_edge_labels
+
+    try:
+        validate_non_negative_number(margin, "margin")
+    except ValidationError as exc:
+        return _err(exc)
+    count = position_edge_labels(d, margin=margin)
+    return f"Repositioned {count} edge label(s)."
+
+
+def _layout_optimize_connections(
+    d: Diagram, *, margin: float, **_: Any,
+) -> str:
+    from drawio_mcp.layout_engine import optimize_edge_paths
+
+    try:
+        validate_non_negative_number(margin, "margin")
+    except ValidationError as exc:
+        return _err(exc)
+    count = optimize_edge_paths(d, margin=margin)
+    return f"Optimized {count} edge path(s): simplified bends, straightened segments, shortened detours, centered channels, separated parallels."
+
+
+def _layout_resize_container(
+    d: Diagram, *, container_id: str, padding: float, **_: Any,
+) -> str:
+    try:
+        validate_non_empty_string(container_id, "container_id")
+        validate_non_negative_number(padding, "padding")
+    except ValidationError as exc:
+        return _err(exc)
+    container = _find_cell(d, container_id)
+    if not container or not container.geometry:
+        return f"Error: container '{container_id}' not found."
+    children = [c for c in d.cells if c.parent == container_id
+                and c.geometry and not c.geometry.relative and c.id != container_id]
+    if not children:
+        return "No children found."
+    header_h = 23
+    if container.style:
+        m = _STARTSIZE_PAT.search(container.style)
+        if m:
+            header_h = int(m.group(1))
+    # One pass over the children instead of four generator scans.
+    g0 = children[0].geometry
+    min_x, min_y = g0.x, g0.y
+    max_x, max_y = g0.x + g0.width, g0.y + g0.height
+    for c in children[1:]:
+        g = c.geometry
+        if g.x < min_x:
+            min_x = g.x
+        if g.y < min_y:
+            min_y = g.y
+        if g.x + g.width > max_x:
+            max_x = g.x + g.width
+        if g.y + g.height > max_y:
+            max_y = g.y + g.height
+    if min_x < padding:
+        shift = padding - min_x
+        for c in children:
+            c.geometry.x += shift
+        max_x += shift
+    if min_y < header_h + padding:
+        shift = header_h + padding - min_y
+        for c in children:
+            c.geometry.y += shift
+        max_y += shift
+    new_w = snap_to_grid(max_x + padding, d.grid_size)
+    new_h = snap_to_grid(max_y + padding, d.grid_size)
+    container.geometry.width = new_w
+    container.geometry.height = new_h
+    return f"Container resized to {new_w}x{new_h}."
+
+
+_LAYOUT_HANDLERS: dict[str, Callable[..., str]] = {
+    "sugiyama": _layout_sugiyama,
+    "tree": _layout_tree,
+    "horizontal": _layout_horizontal,
+    "vertical": _layout_vertical,
+    "grid": _layout_grid,
+    "flowchart": _layout_flowchart,
+    "smart_connect": _layout_smart_connect,
+    "align": _layout_align,
+    "distribute": _layout_distribute,
+    "polish": _layout_polish,
+    "relayout": _layout_relayout,
+    "compact": _layout_compact,
+    "reroute_edges": _layout_reroute_edges,
+    "resolve_overlaps": _layout_resolve_overlaps,
+    "fix_labels": _layout_fix_labels,
+    "optimize_connections": _layout_optimize_connections,
+    "resize_container": _layout_resize_container,
+}
+
+
 # ===================================================================
 # TOOL 4: layout — positioning
 # ===================================================================
 
+# ===================================================================
+
 @mcp.tool()
 def layout(
     action: str,
@@ -1312,433 +2158,148 @@ def layout(
         action = validate_action(action, "layout", _LAYOUT_ACTIONS)
         validate_non_empty_string(diagram_name, "diagram_name")
     except ValidationError as exc:
-        return f"Error: {exc.message}"
-    df = _diagrams.get(diagram_name)
+        return _err(exc)
+    df = _lookup_diagram(diagram_name)
     if not df:
         return f"Error: diagram '{diagram_name}' not found."
+    # Every action below may mutate the document.
+    df.invalidate_xml_cache()
     try:
         validate_page_index(page_index, len(df.diagrams))
     except ValidationError as exc:
-        return f"Error: {exc.message}"
+        return _err(exc)
     d = df.diagrams[page_index]
 
-    # ----- sugiyama -----
-    if action == "sugiyama":
-        conns = connections or []
-        try:
-            validate_list(conns, "connections", min_length=1)
-            for i, c in enumerate(conns):
-                validate_connection_dict(c, i)
-            validate_direction(direction)
-            validate_spacing(rank_spacing, "rank_spacing")
-            validate_spacing(node_spacing, "node_spacing")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        edge_tuples = [(e.get("source", e.get("source_id", "")),
-                        e.get("target", e.get("target_id", "")),
-                        e.get("label", "")) for e in conns]
-        e_style = _resolve_edge_style(edge_style_preset)
-        cfg = LayoutEngineConfig(
-            rank_spacing=rank_spacing, node_spacing=node_spacing,
-            grid_size=d.grid_size, route_edges=True,
-        )
-        mapping = layout_sugiyama(d, edge_tuples, edge_style=e_style,
-                                  config=cfg, direction=direction)
-        return json.dumps(mapping)
-
-    # ----- tree -----
-    elif action == "tree":
-        try:
-            validate_adjacency(adjacency)
-            validate_non_empty_string(root, "root")
-            validate_direction(direction)
-            validate_spacing(h_spacing, "h_spacing")
-            validate_spacing(v_spacing, "v_spacing")
-            validate_positive_number(width, "width")
-            validate_positive_number(height, "height")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        adj = adjacency or {}
-        vs = custom_style or _resolve_vertex_style(style_preset)
-        es = custom_edge_style or _resolve_edge_style(edge_style_preset)
-        cfg = LayoutConfig(h_spacing=h_spacing, v_spacing=v_spacing,
-                           default_width=width, default_height=height)
-        mapping = layout_tree(d, adj, root, vs, es, cfg, direction)
-        return json.dumps(mapping)
-
-    # ----- horizontal -----
-    elif action == "horizontal":
-        lbl_list = labels or []
-        try:
-            validate_list(lbl_list, "labels", min_length=1)
-            validate_spacing(h_spacing, "h_spacing")
-            validate_positive_number(width, "width")
-            validate_positive_number(height, "height")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        vs = custom_style or _resolve_vertex_style(style_preset)
-        cfg = LayoutConfig(start_x=start_x, start_y=start_y, h_spacing=h_spacing,
-                           default_width=width, default_height=height)
-        ids = layout_horizontal(d, lbl_list, vs, cfg)
-        edge_ids: list[str] = []
-        if connect and len(ids) > 1:
-            es = _resolve_edge_style(edge_style_preset)
-            edge_ids = connect_chain(d, ids, es, edge_labels)
-        return json.dumps({"vertex_ids": ids, "edge_ids": edge_ids})
-
-    # ----- vertical -----
-    elif action == "vertical":
-        lbl_list = labels or []
-        try:
-            validate_list(lbl_list, "labels", min_length=1)
-            validate_spacing(v_spacing, "v_spacing")
-            validate_positive_number(width, "width")
-            validate_positive_number(height, "height")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        vs = custom_style or _resolve_vertex_style(style_preset)
-        cfg = LayoutConfig(start_x=start_x, start_y=start_y, v_spacing=v_spacing,
-                           default_width=width, default_height=height)
-        ids = layout_vertical(d, lbl_list, vs, cfg)
-        edge_ids = []
-        if connect and len(ids) > 1:
-            es = _resolve_edge_style(edge_style_preset)
-            edge_ids = connect_chain(d, ids, es, edge_labels)
-        return json.dumps({"vertex_ids": ids, "edge_ids": edge_ids})
-
-    # ----- grid -----
-    elif action == "grid":
-        lbl_list = labels or []
-        try:
-            validate_list(lbl_list, "labels", min_length=1)
-            validate_columns(columns)
-            validate_spacing(h_spacing, "h_spacing")
-            validate_spacing(v_spacing, "v_spacing")
-            validate_positive_number(width, "width")
-            validate_positive_number(height, "height")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        vs = custom_style or _resolve_vertex_style(style_preset)
-        cfg = LayoutConfig(start_x=start_x, start_y=start_y,
-                           h_spacing=h_spacing, v_spacing=v_spacing,
-                           default_width=width, default_height=height)
-        ids = layout_grid(d, lbl_list, columns, vs, cfg)
-        return json.dumps(ids)
-
-    # ----- flowchart -----
-    elif action == "flowchart":
-        step_list = steps or []
-        try:
-            validate_list(step_list, "steps", min_length=1)
-            for i, step in enumerate(step_list):
-                validate_flowchart_step(step, i)
-            validate_direction(direction)
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        type_map = {
-            "process": VertexStyle.FLOWCHART_PROCESS,
-            "decision": VertexStyle.FLOWCHART_DECISION,
-            "terminator": VertexStyle.FLOWCHART_TERMINATOR,
-            "data": VertexStyle.FLOWCHART_DATA,
-            "predefined": VertexStyle.FLOWCHART_PREDEFINED,
-            "manual_input": VertexStyle.FLOWCHART_MANUAL_INPUT,
-            "preparation": VertexStyle.FLOWCHART_PREPARATION,
-            "delay": VertexStyle.FLOWCHART_DELAY,
-            "display": VertexStyle.FLOWCHART_DISPLAY,
-            "stored_data": VertexStyle.FLOWCHART_STORED_DATA,
-        }
-        spacing = 80
-        ids = []
-        for i, step in enumerate(step_list):
-            stype = step.get("type", "process").lower()
-            s = type_map.get(stype, VertexStyle.FLOWCHART_PROCESS)
-            w = 160 if stype == "decision" else 120
-            h = 80 if stype == "decision" else 60
-            if direction == "LR":
-                x, y = 50 + i * (w + spacing), 50
-            else:
-                x, y = 50, 50 + i * (h + spacing)
-            cid = d.add_vertex(step["label"], x, y, w, h, s)
-            ids.append(cid)
-        edge_ids = connect_chain(
-            d, ids,
-            "edgeStyle=orthogonalEdgeStyle;rounded=0;orthogonalLoop=1;"
-            "jettySize=auto;html=1;endArrow=classic;",
+    handler = _LAYOUT_HANDLERS.get(action)
+    if handler is None:
+        return (
+            f"Error: unknown layout action '{action}'. "
+            "Use: sugiyama, tree, horizontal, vertical, grid, flowchart, "
+            "smart_connect, align, distribute, polish, relayout, compact, "
+            "reroute_edges, resolve_overlaps, fix_labels, optimize_connections, "
+            "resize_container."
         )
-        return json.dumps({"vertex_ids": ids, "edge_ids": edge_ids})
-
-    # ----- smart_connect -----
-    elif action == "smart_connect":
-        conns = connections or []
-        try:
-            validate_list(conns, "connections", min_length=1)
-            for i, conn in enumerate(conns):
-                validate_connection_dict(conn, i)
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        s = _resolve_edge_style(edge_style_preset if edge_style_preset and edge_style_preset != "DEFAULT" else "DEFAULT")
-        bounds = get_all_vertex_bounds(d)
-        auto_idx: list[int] = []
-        auto_pairs: list[tuple[str, str]] = []
-        explicit: dict[int, tuple[str, str]] = {}
-
-        for i, conn in enumerate(conns):
-            ep_exit = conn.get("exit_port", "")
-            ep_entry = conn.get("entry_port", "")
-            if ep_exit or ep_entry:
-                explicit[i] = (ep_exit, ep_entry)
-            else:
-                auto_idx.append(i)
-                auto_pairs.append((conn["source_id"], conn["target_id"]))
-
-        bp = distribute_ports_for_batch(auto_pairs, bounds) if auto_pairs else []
-        ids = []
-        for i, conn in enumerate(conns):
-            src_id = conn["source_id"]
-            tgt_id = conn["target_id"]
-            ep = _find_common_parent(d, src_id, tgt_id)
-
-            if i in explicit:
-                exit_name, entry_name = explicit[i]
-                ex, ey, enx, eny = _resolve_ports(d, src_id, tgt_id, exit_name, entry_name, False)
-            else:
-                bidx = auto_idx.index(i)
-                (ex, ey), (enx, eny) = bp[bidx]
+    return handler(
+        d, direction=direction, adjacency=adjacency, root=root,
+        connections=connections, labels=labels, columns=columns,
+        style_preset=style_preset, custom_style=custom_style,
+        edge_style_preset=edge_style_preset, custom_edge_style=custom_edge_style,
+        edge_labels=edge_labels, connect=connect, start_x=start_x,
+        start_y=start_y, h_spacing=h_spacing, v_spacing=v_spacing,
+        width=width, height=height, steps=steps, cell_ids=cell_ids,
+        alignment=alignment, dist_direction=dist_direction,
+        container_id=container_id, padding=padding, margin=margin,
+        rank_spacing=rank_spacing, node_spacing=node_spacing,
+    )
+
+
+def _inspect_ports() -> str:
+    entries: list[str] = []
+    for name in sorted(dir(Port)):
+        if name.startswith("_"):
+            continue
+        val = getattr(Port, name)
+        if isinstance(val, tuple):
+            entries.append(f"  {name}: x={val[0]}, y={val[1]}")
+    return "Connection ports:\n" + "\n".join(entries)
 
-            cid = d.add_edge(src_id, tgt_id, conn.get("label", ""), s, ep)
-            edge_cell = _find_cell(d, cid)
-            if edge_cell:
-                if ex is not None:
-                    edge_cell.exit_x = ex
-                    edge_cell.exit_y = ey
-                if enx is not None:
-                    edge_cell.entry_x = enx
-                    edge_cell.entry_y = eny
-            ids.append(cid)
-
-        route_edges_around_obstacles(d, margin=15)
-        return json.dumps(ids)
-
-    # ----- align -----
-    elif action == "align":
-        try:
-            validate_list(cell_ids or [], "cell_ids", min_length=2)
-            validate_alignment(alignment)
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        cell_list = cell_ids or []
-        cells = [_find_cell(d, cid) for cid in cell_list]
-        cells = [c for c in cells if c and c.geometry and not c.geometry.relative]
-        if len(cells) < 2:
-            return "Need at least 2 cells to align."
-
-        al = alignment.lower()
-        if al == "left":
-            t = min(c.geometry.x for c in cells)
-            for c in cells:
-                c.geometry.x = t
-        elif al == "center":
-            centers = [c.geometry.x + c.geometry.width / 2 for c in cells]
-            t = sum(centers) / len(centers)
-            for c in cells:
-                c.geometry.x = snap_to_grid(t - c.geometry.width / 2, d.grid_size)
-        elif al == "right":
-            t = max(c.geometry.x + c.geometry.width for c in cells)
-            for c in cells:
-                c.geometry.x = snap_to_grid(t - c.geometry.width, d.grid_size)
-        elif al == "top":
-            t = min(c.geometry.y for c in cells)
-            for c in cells:
-                c.geometry.y = t
-        elif al == "middle":
-            centers = [c.geometry.y + c.geometry.height / 2 for c in cells]
-            t = sum(centers) / len(centers)
-            for c in cells:
-                c.geometry.y = snap_to_grid(t - c.geometry.height / 2, d.grid_size)
-        elif al == "bottom":
-            t = max(c.geometry.y + c.geometry.height for c in cells)
-            for c in cells:
-                c.geometry.y = snap_to_grid(t - c.geometry.height, d.grid_size)
-        else:
-            return f"Error: unknown alignment '{al}'."
-        return f"Aligned {len(cells)} cells to '{al}'."
 
-    # ----- distribute -----
-    elif action == "distribute":
-        try:
-            validate_list(cell_ids or [], "cell_ids", min_length=2)
-            validate_string(dist_direction, "dist_direction")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        cell_list = cell_ids or []
-        cells = [_find_cell(d, cid) for cid in cell_list]
-        cells = [c for c in cells if c and c.geometry and not c.geometry.relative]
-        if len(cells) < 2:
-            return "Need at least 2 cells to distribute."
-        dd = dist_direction.lower()
-        if dd == "horizontal":
-            cells.sort(key=lambda c: c.geometry.x)
-            positions = [c.geometry.x for c in cells]
-            sizes = [c.geometry.width for c in cells]
-            start_pos = positions[0]
-            end_pos = positions[-1] + sizes[-1]
-            new_pos = distribute_evenly(positions, sizes, start_pos, end_pos)
-            for cell, nx in zip(cells, new_pos):
-                cell.geometry.x = snap_to_grid(nx, d.grid_size)
+def _inspect_cells(
+    df: DrawioFile, d: Diagram, *, diagram_name: str, margin: float, **_: Any,
+) -> str:
+    cells_info: list[dict[str, Any]] = []
+    for c in d.cells:
+        info: dict[str, Any] = {"id": c.id}
+        if c.value:
+            info["label"] = c.value
+        if c.vertex:
+            info["type"] = "vertex"
+        elif c.edge:
+            info["type"] = "edge"
+            if c.source:
+                info["source"] = c.source
+            if c.target:
+                info["target"] = c.target
+        elif c.parent == "0" and c.id != "0":
+            info["type"] = "layer"
         else:
-            cells.sort(key=lambda c: c.geometry.y)
-            positions = [c.geometry.y for c in cells]
-            sizes = [c.geometry.height for c in cells]
-            start_pos = positions[0]
-            end_pos = positions[-1] + sizes[-1]
-            new_pos = distribute_evenly(positions, sizes, start_pos, end_pos)
-            for cell, ny in zip(cells, new_pos):
-                cell.geometry.y = snap_to_grid(ny, d.grid_size)
-        return f"Distributed {len(cells)} cells {dd}ly."
-
-    # ----- polish -----
-    elif action == "polish":
-        try:
-            validate_direction(direction)
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        results: list[str] = []
-        cfg = LayoutEngineConfig(grid_size=d.grid_size)
-        moved = relayout_diagram(d, direction=direction, config=cfg)
-        results.append(f"Relayout: {len(moved)} shapes")
-        om = resolve_overlaps(d, margin=20)
-        results.append(f"Overlaps: {om} fixes")
-        cm = compact_diagram(d, margin=40)
-        results.append(f"Compact: {cm} adjusted")
-        # Auto-alignment pass
-        bl = align_rank_baselines(d, threshold=20)
-        cl = align_column_centers(d, threshold=20)
-        eq = equalize_connected_sizes(d, direction=direction)
-        results.append(f"Aligned: {bl} rows, {cl} cols, {eq} equalized")
-        routed = route_edges_around_obstacles(d, margin=15)
-        results.append(f"Routing: {routed} edges")
-        opt = optimize_edge_paths(d, margin=15)
-        results.append(f"Optimized: {opt} edges")
-        lf = position_edge_labels(d, margin=8)
-        results.append(f"Labels: {lf} fixed")
-        # Final pass: center on page and enforce margins
-        cp = center_diagram_on_page(d, margin=50)
-        pm = ensure_page_margins(d, margin=40)
-        results.append(f"Centered: {cp}, Margins: {pm}")
-        return "Polished! " + " | ".join(results)
-
-    # ----- relayout -----
-    elif action == "relayout":
-        try:
-            validate_direction(direction)
-            validate_spacing(rank_spacing, "rank_spacing")
-            validate_spacing(node_spacing, "node_spacing")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        cfg = LayoutEngineConfig(rank_spacing=rank_spacing, node_spacing=node_spacing,
-                                 grid_size=d.grid_size)
-        moved = relayout_diagram(d, direction=direction, config=cfg)
-        ensure_page_margins(d, margin=40)
-        return f"Repositioned {len(moved)} shape(s)."
-
-    # ----- compact -----
-    elif action == "compact":
-        try:
-            validate_non_negative_number(margin, "margin")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        count = compact_diagram(d, margin=margin)
-        return f"Compacted: {count} shape(s) adjusted."
+            info["type"] = "structural"
+        # Include metadata if present
+        if c.tooltip:
+            info["tooltip"] = c.tooltip
+        if c.link:
+            info["link"] = c.link
+        if c.metadata:
+            info["metadata"] = c.metadata
+        effective_style = c.style or ""
+        if c.edge:
+            # Each port block has a fixed shape, so build it as one
+            # f-string instead of five list appends plus a join.
+            ports = ""
+            if c.exit_x is not None:
+                ports = (f"exitX={c.exit_x};exitY={c.exit_y or 0};"
+                         f"exitDx={c.exit_dx};exitDy={c.exit_dy};exitPerimeter=0")
+            if c.entry_x is not None:
+                entry = (f"entryX={c.entry_x};entryY={c.entry_y or 0};"
+                         f"entryDx={c.entry_dx};entryDy={c.entry_dy};entryPerimeter=0")
+                ports = f"{ports};{entry}" if ports else entry
+            if ports:
+                effective_style = effective_style.rstrip(";") + ";" + ports + ";"
+        if effective_style:
+            info["style"] = effective_style
+        if c.parent:
+            info["parent"] = c.parent
+        if c.geometry and not c.geometry.relative:
+            info["position"] = {"x": c.geometry.x, "y": c.geometry.y,
+                                "width": c.geometry.width, "height": c.geometry.height}
+        cells_info.append(info)
+    return _pretty_encode(cells_info)
+
+
+def _inspect_overlaps(
+    df: DrawioFile, d: Diagram, *, diagram_name: str, margin: float, **_: Any,
+) -> str:
+    from drawio_mcp.layout_engine import find_overlapping_cells
 
-    # ----- reroute_edges -----
-    elif action == "reroute_edges":
-        try:
-            validate_non_negative_number(margin, "margin")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        count = route_edges_around_obstacles(d, margin=margin)
-        return f"Rerouted {count} edge(s)."
+    overlaps = find_overlapping_cells(d, margin=margin)
+    if not overlaps:
+        return "No overlaps found. Diagram is clean!"
+    cell_labels = {c.id: c.value for c in d.cells if c.value}
+    get = cell_labels.get
+    report = [{"cell_a": a, "label_a": get(a, ""),
+                "cell_b": b, "label_b": get(b, "")}
+               for a, b in overlaps]
+    return _pretty_encode(report)
 
-    # ----- resolve_overlaps -----
-    elif action == "resolve_overlaps":
-        try:
-            validate_non_negative_number(margin, "margin")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        before = find_overlapping_cells(d, margin=0)
-        if not before:
-            return "No overlaps found. Diagram is clean!"
-        moves = resolve_overlaps(d, margin=margin)
-        after = find_overlapping_cells(d, margin=0)
-        return f"Found {len(before)} overlaps. {moves} adjustments. Remaining: {len(after)}."
-
-    # ----- fix_labels -----
-    elif action == "fix_labels":
-        try:
-            validate_non_negative_number(margin, "margin")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        count = position_edge_labels(d, margin=margin)
-        return f"Repositioned {count} edge label(s)."
 
-    # ----- optimize_connections -----
-    elif action == "optimize_connections":
-        try:
-            validate_non_negative_number(margin, "margin")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        count = optimize_edge_paths(d, margin=margin)
-        return f"Optimized {count} edge path(s): simplified bends, straightened segments, shortened detours, centered channels, separated parallels."
+def _inspect_info(
+    df: DrawioFile, d: Diagram, *, diagram_name: str, margin: float, **_: Any,
+) -> str:
+    pages: list[dict[str, Any]] = []
+    for i, pg in enumerate(df.diagrams):
+        # One pass per page instead of three generator scans.
+        vc = ec = lc = 0
+        for c in pg.cells:
+            if c.vertex:
+                vc += 1
+            if c.edge:
+                ec += 1
+            if c.parent == "0" and c.id != "0":
+                lc += 1
+        pages.append({"index": i, "name": pg.name, "vertices": vc, "edges": ec, "layers": lc})
+    return _pretty_encode({"name": diagram_name, "pages": pages})
 
-    # ----- resize_container -----
-    elif action == "resize_container":
-        try:
-            validate_non_empty_string(container_id, "container_id")
-            validate_non_negative_number(padding, "padding")
-        except ValidationError as exc:
-            return f"Error: {exc.message}"
-        container = _find_cell(d, container_id)
-        if not container or not container.geometry:
-            return f"Error: container '{container_id}' not found."
-        children = [c for c in d.cells if c.parent == container_id
-                    and c.geometry and not c.geometry.relative and c.id != container_id]
-        if not children:
-            return "No children found."
-        header_h = 23
-        if container.style:
-            m = re.search(r"startSize=(\d+)", container.style)
-            if m:
-                header_h = int(m.group(1))
-        min_x = min(c.geometry.x for c in children)
-        min_y = min(c.geometry.y for c in children)
-        max_x = max(c.geometry.x + c.geometry.width for c in children)
-        max_y = max(c.geometry.y + c.geometry.height for c in children)
-        if min_x < padding:
-            shift = padding - min_x
-            for c in children:
-                c.geometry.x += shift
-            max_x += shift
-        if min_y < header_h + padding:
-            shift = header_h + padding - min_y
-            for c in children:
-                c.geometry.y += shift
-            max_y += shift
-        new_w = snap_to_grid(max_x + padding, d.grid_size)
-        new_h = snap_to_grid(max_y + padding, d.grid_size)
-        container.geometry.width = new_w
-        container.geometry.height = new_h
-        return f"Container resized to {new_w}x{new_h}."
 
-    else:
-        return (
-            f"Error: unknown layout action '{action}'. "
-            "Use: sugiyama, tree, horizontal, vertical, grid, flowchart, "
-            "smart_connect, align, distribute, polish, relayout, compact, "
-            "reroute_edges, resolve_overlaps, fix_labels, optimize_connections, "
-            "resize_container."
-        )
+_INSPECT_HANDLERS: dict[str, Callable[..., str]] = {
+    "cells": _inspect_cells,
+    "overlaps": _inspect_overlaps,
+    "info": _inspect_info,
+}
 
 
+# ===================================================================
+# TOOL 5: inspect — read-only queries
+# ===================================================================
 # ===================================================================
 # TOOL 5: inspect — read-only queries
 # ===================================================================
@@ -1772,172 +2333,88 @@ def inspect(
     try:
         action = validate_action(action, "inspect", _INSPECT_ACTIONS)
     except ValidationError as exc:
-        return f"Error: {exc.message}"
+        return _err(exc)
 
     if action == "ports":
-        entries: list[str] = []
-        for name in sorted(dir(Port)):
-            if name.startswith("_"):
-                continue
-            val = getattr(Port, name)
-            if isinstance(val, tuple):
-                entries.append(f"  {name}: x={val[0]}, y={val[1]}")
-        return "Connection ports:\n" + "\n".join(entries)
+        return _inspect_ports()
 
     # All other actions need a diagram
     try:
         validate_non_empty_string(diagram_name, "diagram_name")
     except ValidationError as exc:
-        return f"Error: {exc.message}"
-    df = _diagrams.get(diagram_name)
+        return _err(exc)
+    df = _lookup_diagram(diagram_name)
     if not df:
         return f"Error: diagram '{diagram_name}' not found."
     try:
         validate_page_index(page_index, len(df.diagrams))
     except ValidationError as exc:
-        return f"Error: {exc.message}"
+        return _err(exc)
     d = df.diagrams[page_index]
 
-    if action == "cells":
-        cells_info: list[dict[str, Any]] = []
-        for c in d.cells:
-            info: dict[str, Any] = {"id": c.id}
-            if c.value:
-                info["label"] = c.value
-            if c.vertex:
-                info["type"] = "vertex"
-            elif c.edge:
-                info["type"] = "edge"
-                if c.source:
-                    info["source"] = c.source
-                if c.target:
-                    info["target"] = c.target
-            elif c.parent == "0" and c.id != "0":
-                info["type"] = "layer"
-            else:
-                info["type"] = "structural"
-            # Include metadata if present
-            if c.tooltip:
-                info["tooltip"] = c.tooltip
-            if c.link:
-                info["link"] = c.link
-            if c.metadata:
-                info["metadata"] = c.metadata
-            effective_style = c.style or ""
-            if c.edge:
-                port_parts: list[str] = []
-                if c.exit_x is not None:
-                    port_parts += [f"exitX={c.exit_x}", f"exitY={c.exit_y or 0}",
-                                   f"exitDx={c.exit_dx}", f"exitDy={c.exit_dy}",
-                                   "exitPerimeter=0"]
-                if c.entry_x is not None:
-                    port_parts += [f"entryX={c.entry_x}", f"entryY={c.entry_y or 0}",
-                                   f"entryDx={c.entry_dx}", f"entryDy={c.entry_dy}",
-                                   "entryPerimeter=0"]
-                if port_parts:
-                    effective_style = effective_style.rstrip(";") + ";" + ";".join(port_parts) + ";"
-            if effective_style:
-                info["style"] = effective_style
-            if c.parent:
-                info["parent"] = c.parent
-            if c.geometry and not c.geometry.relative:
-                info["position"] = {"x": c.geometry.x, "y": c.geometry.y,
-                                    "width": c.geometry.width, "height": c.geometry.height}
-            cells_info.append(info)
-        return json.dumps(cells_info, indent=2)
-
-    elif action == "overlaps":
-        overlaps = find_overlapping_cells(d, margin=margin)
-        if not overlaps:
-            return "No overlaps found. Diagram is clean!"
-        cell_labels: dict[str, str] = {}
-        for cell in d.cells:
-            if cell.value:
-                cell_labels[cell.id] = cell.value
-        report = [{"cell_a": a, "label_a": cell_labels.get(a, ""),
-                    "cell_b": b, "label_b": cell_labels.get(b, "")}
-                   for a, b in overlaps]
-        return json.dumps(report, indent=2)
-
-    elif action == "info":
-        pages: list[dict[str, Any]] = []
-        for i, pg in enumerate(df.diagrams):
-            vc = sum(1 for c in pg.cells if c.vertex)
-            ec = sum(1 for c in pg.cells if c.edge)
-            lc = sum(1 for c in pg.cells if c.parent == "0" and c.id != "0")
-            pages.append({"index": i, "name": pg.name, "vertices": vc, "edges": ec, "layers": lc})
-        return json.dumps({"name": diagram_name, "pages": pages}, indent=2)
-
-    else:
+    handler = _INSPECT_HANDLERS.get(action)
+    if handler is None:
         return f"Error: unknown inspect action '{action}'. Use: cells, overlaps, ports, info."
+    return handler(df, d, diagram_name=diagram_name, margin=margin)
 
 
 # ===================================================================
 # Internal helpers
 # ===================================================================
 
-_VERTEX_ALIAS_MAP: dict[str, str] | None = None
-_EDGE_ALIAS_MAP: dict[str, str] | None = None
+# Family prefixes whose bare suffix is also accepted as a preset alias.
+_STYLE_PREFIXES: tuple[str, ...] = ("FLOWCHART_", "UML_", "BPMN_", "ER_", "C4_",
+                                    "STATE_", "MINDMAP_", "SEQUENCE_")
 
 
 def _build_alias_map(cls: type) -> dict[str, str]:
     mapping: dict[str, str] = {}
-    for attr in dir(cls):
-        if attr.startswith("_"):
-            continue
-        val = getattr(cls, attr)
-        if not isinstance(val, str):
+    for attr, val in vars(cls).items():
+        if attr.startswith("_") or not isinstance(val, str):
             continue
         key = attr.upper()
         mapping[key] = val
-        for prefix in ("FLOWCHART_", "UML_", "BPMN_", "ER_", "C4_",
-                        "STATE_", "MINDMAP_", "SEQUENCE_"):
+        for prefix in _STYLE_PREFIXES:
             if key.startswith(prefix):
-                suffix = key[len(prefix):]
-                if suffix not in mapping:
-                    mapping[suffix] = val
-        no_us = key.replace("_", "")
-        if no_us not in mapping:
-            mapping[no_us] = val
+                mapping.setdefault(key[len(prefix):], val)
+                break  # prefixes are disjoint; at most one can match
+        mapping.setdefault(key.replace("_", ""), val)
     return mapping
 
 
+# Built eagerly at import: the preset classes are pure constant data,
+# and the maps already contain every attribute under its exact
+# uppercase name, so the resolvers below need no getattr probing.
+_VERTEX_ALIAS_MAP: dict[str, str] = _build_alias_map(VertexStyle)
+_EDGE_ALIAS_MAP: dict[str, str] = _build_alias_map(EdgeStylePreset)
+
+
+@functools.lru_cache(maxsize=64)
 def _resolve_vertex_style(preset_name: str) -> str:
-    global _VERTEX_ALIAS_MAP
     if not preset_name:
         return VertexStyle.ROUNDED_RECTANGLE
-    val = getattr(VertexStyle, preset_name.upper(), None)
-    if val and isinstance(val, str):
-        return val
-    if _VERTEX_ALIAS_MAP is None:
-        _VERTEX_ALIAS_MAP = _build_alias_map(VertexStyle)
     key = preset_name.upper().replace(" ", "_")
-    if key in _VERTEX_ALIAS_MAP:
-        return _VERTEX_ALIAS_MAP[key]
-    no_us = key.replace("_", "")
-    if no_us in _VERTEX_ALIAS_MAP:
-        return _VERTEX_ALIAS_MAP[no_us]
+    val = _VERTEX_ALIAS_MAP.get(key)
+    if val is None:
+        val = _VERTEX_ALIAS_MAP.get(key.replace("_", ""))
+    if val is not None:
+        return val
     if "=" in preset_name or ";" in preset_name:
         return preset_name
     logger.warning("Unknown vertex preset '%s', using ROUNDED_RECTANGLE", preset_name)
     return VertexStyle.ROUNDED_RECTANGLE
 
 
+@functools.lru_cache(maxsize=64)
 def _resolve_edge_style(preset_name: str) -> str:
-    global _EDGE_ALIAS_MAP
     if not preset_name:
         return EdgeStylePreset.DEFAULT
-    val = getattr(EdgeStylePreset, preset_name.upper(), None)
-    if val and isinstance(val, str):
-        return val
-    if _EDGE_ALIAS_MAP is None:
-        _EDGE_ALIAS_MAP = _build_alias_map(EdgeStylePreset)
     key = preset_name.upper().replace(" ", "_")
-    if key in _EDGE_ALIAS_MAP:
-        return _EDGE_ALIAS_MAP[key]
-    no_us = key.replace("_", "")
-    if no_us in _EDGE_ALIAS_MAP:
-        return _EDGE_ALIAS_MAP[no_us]
+    val = _EDGE_ALIAS_MAP.get(key)
+    if val is None:
+        val = _EDGE_ALIAS_MAP.get(key.replace("_", ""))
+    if val is not None:
+        return val
     if "=" in preset_name or ";" in preset_name:
         return preset_name
     logger.warning("Unknown edge preset '%s', using DEFAULT", preset_name)
@@ -1945,18 +2422,57 @@ def _resolve_edge_style(preset_name: str) -> str:
 
 
 def _find_cell(d: Diagram, cell_id: str) -> MxCell | None:
-    for cell in d.cells:
-        if cell.id == cell_id:
-            return cell
-    return None
+    return d.find_cell(cell_id)
+
 
+# One-pass decode of the three entities draw.io labels commonly carry.
+_ENTITY_PAT = re.compile(r"&(amp|lt|gt);")
+_ENTITY_MAP = {"amp": "&", "lt": "<", "gt": ">"}
 
+
+def _decode_entities(text: str) -> str:
+    return _ENTITY_PAT.sub(lambda m: _ENTITY_MAP[m.group(1)], text)
+
+
+def _strip_html_tags(label: str) -> str:
+    """One-pass tag stripper for size estimation.
+
+    Walks the label once with str.find, dropping <...> runs and turning
+    <br>/<br/> variants into newlines — the combined effect of the two
+    regex substitution passes this replaces.
+    """
+    parts: list[str] = []
+    i = 0
+    find = label.find
+    while True:
+        lt = find("<", i)
+        if lt == -1:
+            parts.append(label[i:])
+            break
+        gt = find(">", lt + 1)
+        if gt == -1:
+            # Unterminated tag — the old regexes left it in place.
+            parts.append(label[i:])
+            break
+        parts.append(label[i:lt])
+        tag = label[lt + 1:gt]
+        if not tag:
+            parts.append("<>")  # bare <> is not a tag; keep it
+        else:
+            t = tag.lower()
+            if t.startswith("br") and t[2:].strip() in ("", "/"):
+                parts.append("\n")
+        i = gt + 1
+    return "".join(parts)
+
+
+@functools.lru_cache(maxsize=4096)
 def _estimate_size(label: str, default_w: float, default_h: float) -> tuple[float, float]:
     if (default_w, default_h) != (120, 60):
         return default_w, default_h
-    text = re.sub(r"<br\s*/?>", "\n", label, flags=re.IGNORECASE)
-    text = re.sub(r"<[^>]+>", "", text)
-    text = text.replace("&amp;", "&").replace("&lt;", "<").replace("&gt;", ">")
+    text = _strip_html_tags(label) if "<" in label else label
+    if "&" in text:
+        text = _decode_entities(text)
     lines = [l.strip() for l in text.split("\n") if l.strip()]
     if not lines:
         lines = [text.strip() or "X"]
@@ -1968,66 +2484,102 @@ def _estimate_size(label: str, default_w: float, default_h: float) -> tuple[floa
 
 
 def _abs_to_relative(d: Diagram, x: float, y: float, parent_id: str) -> tuple[float, float]:
-    if parent_id in ("1", "0", ""):
+    if parent_id in _ROOT_PARENT_IDS:
         return x, y
-    offset_x, offset_y = 0.0, 0.0
-    current_id = parent_id
-    visited: set[str] = set()
-    while current_id and current_id not in ("0", "1") and current_id not in visited:
-        visited.add(current_id)
+    # Unrolled first hop: most nested cells sit one container deep, so the
+    # common case never allocates the cycle-guard set below.
+    parent_cell = _find_cell(d, parent_id)
+    if parent_cell is None:
+        return x, y
+    g = parent_cell.geometry
+    if g and not g.relative:
+        offset_x, offset_y = g.x, g.y
+    else:
+        offset_x, offset_y = 0.0, 0.0
+    current_id = parent_cell.parent
+    if not current_id or current_id in _ROOT_PARENT_IDS or current_id == parent_id:
+        return x - offset_x, y - offset_y
+    # Deep nesting: walk the remaining ancestors with a hop cap instead of
+    # a visited set — well-formed trees are a handful of levels deep, and
+    # the cap still terminates on a malformed parent cycle.
+    for _ in range(_MAX_NESTING_DEPTH):
+        if not current_id or current_id in _STRUCTURAL_IDS:
+            return x - offset_x, y - offset_y
         parent_cell = _find_cell(d, current_id)
-        if parent_cell and parent_cell.geometry and not parent_cell.geometry.relative:
-            offset_x += parent_cell.geometry.x
-            offset_y += parent_cell.geometry.y
-        current_id = parent_cell.parent if parent_cell else ""
+        if parent_cell is None:
+            return x - offset_x, y - offset_y
+        g = parent_cell.geometry
+        if g and not g.relative:
+            offset_x += g.x
+            offset_y += g.y
+        current_id = parent_cell.parent
+    logger.warning("Parent chain for '%s' exceeds %d levels; possible cycle.",
+                   parent_id, _MAX_NESTING_DEPTH)
     return x - offset_x, y - offset_y
 
 
-def _ancestor_chain(d: Diagram, cell_id: str) -> list[str]:
-    chain: list[str] = []
-    current = cell_id
-    visited: set[str] = set()
-    while current and current not in visited:
-        visited.add(current)
-        chain.append(current)
-        cell = _find_cell(d, current)
-        current = cell.parent if cell else ""
-    return chain
+def _parent_map(d: Diagram) -> dict[str, str]:
+    """Map each cell id to its parent id, for O(1) ancestor walks."""
+    return {cell.id: cell.parent or "" for cell in d.cells}
 
 
-def _find_common_parent(d: Diagram, source_id: str, target_id: str) -> str:
-    src_chain = _ancestor_chain(d, source_id)
-    tgt_set = set(_ancestor_chain(d, target_id))
-    for ancestor in src_chain:
-        if ancestor in tgt_set and ancestor not in (source_id, target_id):
-            return ancestor
+def _common_parent(parents: dict[str, str], source_id: str, target_id: str) -> str:
+    """Lowest common ancestor of two cells given a precomputed parent map.
+
+    Walks the target's ancestry into a small list, then walks up from
+    the source returning the first shared id (excluding the endpoints).
+    Chains are a handful of ids, so a list `in` scan beats set hashing;
+    the hop cap bounds both walks on malformed parent cycles.
+    """
+    get = parents.get
+    tgt_chain: list[str] = []
+    current = target_id
+    for _ in range(_MAX_NESTING_DEPTH):
+        if not current:
+            break
+        tgt_chain.append(current)
+        current = get(current, "")
+    current = source_id
+    for _ in range(_MAX_NESTING_DEPTH):
+        if not current:
+            break
+        if current in tgt_chain and current != source_id and current != target_id:
+            return current
+        current = get(current, "")
     return "1"
 
 
+def _find_common_parent(d: Diagram, source_id: str, target_id: str) -> str:
+    return _common_parent(_parent_map(d), source_id, target_id)
+
+
+# Named port positions are constant data; build the lookup once at
+# import instead of reflecting over Port on every edge inserted.
+_PORT_MAP: dict[str, tuple[float, float]] = {
+    attr.upper(): val
+    for attr, val in vars(Port).items()
+    if not attr.startswith("_") and isinstance(val, tuple) and len(val) == 2
+}
+
+
 def _resolve_ports(
     d: Diagram, source_id: str, target_id: str,
     exit_port: str, entry_port: str, smart_ports: bool,
+    bounds: dict[str, CellBounds] | None = None,
 ) -> tuple[float | None, float | None, float | None, float | None]:
-    port_map: dict[str, tuple[float, float]] = {}
-    for attr in dir(Port):
-        if attr.startswith("_"):
-            continue
-        val = getattr(Port, attr)
-        if isinstance(val, tuple) and len(val) == 2:
-            port_map[attr.upper()] = val
-
     ex, ey = None, None
     enx, eny = None, None
     if exit_port:
-        key = exit_port.upper().replace(" ", "_")
-        if key in port_map:
-            ex, ey = port_map[key]
+        port = _PORT_MAP.get(exit_port.upper().replace(" ", "_"))
+        if port is not None:
+            ex, ey = port
     if entry_port:
-        key = entry_port.upper().replace(" ", "_")
-        if key in port_map:
-            enx, eny = port_map[key]
+        port = _PORT_MAP.get(entry_port.upper().replace(" ", "_"))
+        if port is not None:
+            enx, eny = port
     if ex is None and enx is None and smart_ports:
-        bounds = get_all_vertex_bounds(d)
+        if bounds is None:
+            bounds = get_all_vertex_bounds(d)
         src_b = bounds.get(source_id)
         tgt_b = bounds.get(target_id)
         if src_b and tgt_b:
@@ -2035,6 +2587,22 @@ def _resolve_ports(
     return ex, ey, enx, eny
 
 
+def _theme_probes(t: ColorTheme) -> tuple[str, ...]:
+    """Substrings a style must contain for re-theming to be a no-op.
+
+    StyleBuilder.build always emits a trailing semicolon after each entry,
+    so the probes cannot false-match on a color that merely shares a prefix.
+    """
+    probes = (
+        f"fillColor={t.fill};",
+        f"strokeColor={t.stroke};",
+        f"fontColor={t.font};",
+    )
+    if t.gradient:
+        probes += (f"gradientColor={t.gradient};",)
+    return probes
+
+
 def _apply_theme_impl(d: Diagram, theme: str) -> int:
     if not theme:
         return 0
@@ -2042,205 +2610,289 @@ def _apply_theme_impl(d: Diagram, theme: str) -> int:
     if not isinstance(t, ColorTheme):
         return 0
     count = 0
+    # A style already carrying all of the theme's colors would be rewritten
+    # to itself; a substring probe is far cheaper than the parse/rebuild.
+    probes = _theme_probes(t)
+    # Many cells share the exact same style string; parse/theme/rebuild each
+    # distinct input once and reuse the result.
+    themed_cache: dict[str, str] = {}
+    t_apply = t.apply
     for cell in d.cells:
-        if cell.id in ("0", "1"):
+        if cell.id in _STRUCTURAL_IDS:
             continue
-        if not cell.style:
+        style = cell.style
+        if not style:
             continue
-        sb = StyleBuilder(cell.style)
-        t.apply(sb)
-        cell.style = sb.build()
+        themed_style = themed_cache.get(style)
+        if themed_style is None:
+            if all(p in style for p in probes):
+                # Already fully themed — cache the identity result so
+                # repeats of this style cost one dict probe, not the scan.
+                themed_style = style
+            else:
+                sb = StyleBuilder(style)
+                t_apply(sb)
+                themed_style = sb.build()
+            themed_cache[style] = themed_style
+        cell.style = themed_style
         count += 1
     return count
 
 
-def _parse_style_float(style: str, key: str) -> float | None:
-    """Extract a float value for a key from a draw.io style string, or None."""
-    m = re.search(rf"(?:^|;){key}=([^;]+)", style)
-    if m:
-        try:
-            return float(m.group(1))
-        except ValueError:
-            pass
-    return None
+def _style_value_map(style: str) -> dict[str, str]:
+    """Split a draw.io style string into a key=value map (first key wins)."""
+    out: dict[str, str] = {}
+    for seg in style.split(";"):
+        eq = seg.find("=")
+        if eq > 0:
+            key = seg[:eq]
+            if key not in out:
+                out[key] = seg[eq + 1:]
+    return out
+
+
+def _style_float(values: dict[str, str], key: str) -> float | None:
+    """Fetch a float value from a pre-split style map, or None."""
+    try:
+        return float(values[key])
+    except (KeyError, ValueError):
+        return None
 
 
 def _import_xml_impl(name: str, xml_content: str) -> str:
-    import xml.etree.ElementTree as ET
+    """Import draw.io XML from a string, stream-parsing with iterparse.
+
+    Each <diagram> page is converted as soon as its end tag arrives and
+    its subtree cleared, so peak memory holds one page's DOM instead of
+    the whole document's tree alongside the parsed cells.
+    """
+    parsed: list[Diagram] = []
+    root = None
+    try:
+        for event, elem in ET.iterparse(StringIO(xml_content), events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                    if root.tag not in ("mxfile", "mxGraphModel"):
+                        return "Error: unrecognized root element."
+                continue
+            if root.tag == "mxfile" and elem.tag == "diagram":
+                d_obj = _parse_diagram_element(elem)
+                if d_obj is not None:
+                    parsed.append(d_obj)
+                elem.clear()
+    except ET.ParseError as exc:
+        return f"Error parsing XML: {exc}"
+    if root is None:
+        return "Error: unrecognized root element."
+    if root.tag == "mxGraphModel":
+        diag_el = ET.Element("diagram", attrib={"name": name, "id": "imported"})
+        diag_el.append(root)
+        d_obj = _parse_diagram_element(diag_el)
+        if d_obj is not None:
+            parsed.append(d_obj)
+    return _finish_import(name, parsed)
+
+
+def _import_xml_from_path(name: str, path: Path) -> str:
+    """Import a .drawio file by parsing it straight from disk.
+
+    ET.parse feeds the file into expat incrementally, so the document is
+    never materialized as a decoded Python string the way read_text +
+    fromstring would.
+    """
     try:
-        root = ET.fromstring(xml_content)
+        root = ET.parse(path).getroot()
+    except FileNotFoundError:
+        return f"Error: file '{path}' not found."
     except ET.ParseError as exc:
         return f"Error parsing XML: {exc}"
+    return _import_root_impl(name, root)
 
+
+def _import_root_impl(name: str, root) -> str:
     parsed: list[Diagram] = []
     if root.tag == "mxfile":
-        diagram_elements = root.findall("diagram")
+        for diag_el in root.findall("diagram"):
+            d_obj = _parse_diagram_element(diag_el)
+            if d_obj is not None:
+                parsed.append(d_obj)
     elif root.tag == "mxGraphModel":
         diag_el = ET.Element("diagram", attrib={"name": name, "id": "imported"})
         diag_el.append(root)
-        diagram_elements = [diag_el]
+        d_obj = _parse_diagram_element(diag_el)
+        if d_obj is not None:
+            parsed.append(d_obj)
     else:
         return "Error: unrecognized root element."
+    return _finish_import(name, parsed)
 
-    for diag_el in diagram_elements:
-        model_el = diag_el.find("mxGraphModel")
-        if model_el is None:
-            continue
-        d_obj = Diagram(
-            name=diag_el.get("name", "Page"),
-            id=diag_el.get("id", "imported"),
-            cells=[],
-        )
-        d_obj.grid = model_el.get("grid", "1") == "1"
-        d_obj.grid_size = int(model_el.get("gridSize", "10"))
-        d_obj.page_width = int(model_el.get("pageWidth", "827"))
-        d_obj.page_height = int(model_el.get("pageHeight", "1169"))
-        d_obj.background = model_el.get("background", "none")
-        d_obj.shadow = model_el.get("shadow", "0") == "1"
-        d_obj.math = model_el.get("math", "0") == "1"
-
-        root_el = model_el.find("root")
-        if root_el is None:
-            continue
-        max_id = 1
-
-        def _parse_cell_element(
-            cell_el: ET.Element,
-            obj_tooltip: str = "",
-            obj_link: str = "",
-            obj_placeholders: bool = False,
-            obj_metadata: dict[str, str] | None = None,
-            obj_label: str = "",
-            obj_id: str = "",
-        ) -> MxCell:
-            """Parse an mxCell element into an MxCell, with optional <object> metadata."""
-            cid = obj_id or cell_el.get("id", "")
-            label = obj_label or cell_el.get("value", "")
-            geom_el = cell_el.find("mxGeometry")
-            geometry = None
-            if geom_el is not None:
-                geometry = Geometry(
-                    x=float(geom_el.get("x", "0")),
-                    y=float(geom_el.get("y", "0")),
-                    width=float(geom_el.get("width", "0")),
-                    height=float(geom_el.get("height", "0")),
-                    relative=geom_el.get("relative", "0") == "1",
-                )
-                # Parse waypoints from <Array as="points">
-                arr_el = geom_el.find("Array[@as='points']")
-                if arr_el is not None:
-                    for pt_el in arr_el.findall("mxPoint"):
-                        geometry.points.append(Point(
-                            float(pt_el.get("x", "0")),
-                            float(pt_el.get("y", "0")),
-                        ))
-                # Parse offset from <mxPoint as="offset">
-                offset_el = geom_el.find("mxPoint[@as='offset']")
-                if offset_el is not None:
-                    geometry.offset = Point(
-                        float(offset_el.get("x", "0")),
-                        float(offset_el.get("y", "0")),
-                    )
-                # Parse source/target points
-                src_pt_el = geom_el.find("mxPoint[@as='sourcePoint']")
-                if src_pt_el is not None:
-                    geometry.source_point = Point(
-                        float(src_pt_el.get("x", "0")),
-                        float(src_pt_el.get("y", "0")),
-                    )
-                tgt_pt_el = geom_el.find("mxPoint[@as='targetPoint']")
-                if tgt_pt_el is not None:
-                    geometry.target_point = Point(
-                        float(tgt_pt_el.get("x", "0")),
-                        float(tgt_pt_el.get("y", "0")),
-                    )
-                # Parse alternate bounds
-                alt_el = geom_el.find("mxGeometry[@as='alternateBounds']")
-                if alt_el is not None:
-                    geometry.alternate_bounds = Geometry(
-                        x=float(alt_el.get("x", "0")),
-                        y=float(alt_el.get("y", "0")),
-                        width=float(alt_el.get("width", "0")),
-                        height=float(alt_el.get("height", "0")),
-                    )
-
-            # Parse edge port constraints from style string
-            cell_style = cell_el.get("style", "")
-            exit_x_val = _parse_style_float(cell_style, "exitX")
-            exit_y_val = _parse_style_float(cell_style, "exitY")
-            entry_x_val = _parse_style_float(cell_style, "entryX")
-            entry_y_val = _parse_style_float(cell_style, "entryY")
-
-            return MxCell(
-                id=cid, value=label,
-                style=cell_style,
-                parent=cell_el.get("parent", ""),
-                vertex=cell_el.get("vertex", "0") == "1",
-                edge=cell_el.get("edge", "0") == "1",
-                source=cell_el.get("source"),
-                target=cell_el.get("target"),
-                geometry=geometry,
-                exit_x=exit_x_val,
-                exit_y=exit_y_val,
-                entry_x=entry_x_val,
-                entry_y=entry_y_val,
-                tooltip=obj_tooltip or None,
-                link=obj_link or None,
-                placeholders=obj_placeholders,
-                metadata=obj_metadata or {},
-            )
-
-        for child_el in root_el:
-            if child_el.tag == "mxCell":
-                cell = _parse_cell_element(child_el)
-                d_obj.cells.append(cell)
-                try:
-                    if int(cell.id) > max_id:
-                        max_id = int(cell.id)
-                except ValueError:
-                    pass
-            elif child_el.tag == "object" or child_el.tag == "UserObject":
-                # <object> or <UserObject> wraps an <mxCell> with metadata
-                obj_id = child_el.get("id", "")
-                obj_label = child_el.get("label", "")
-                obj_tooltip = child_el.get("tooltip", "")
-                obj_link = child_el.get("link", "")
-                obj_placeholders = child_el.get("placeholders", "0") == "1"
-                # Collect custom metadata (all attributes except known ones)
-                _KNOWN_OBJ_ATTRS = {"id", "label", "tooltip", "link", "placeholders"}
-                obj_metadata = {
-                    k: v for k, v in child_el.attrib.items()
-                    if k not in _KNOWN_OBJ_ATTRS
-                }
-                inner_cell = child_el.find("mxCell")
-                if inner_cell is not None:
-                    cell = _parse_cell_element(
-                        inner_cell,
-                        obj_tooltip=obj_tooltip,
-                        obj_link=obj_link,
-                        obj_placeholders=obj_placeholders,
-                        obj_metadata=obj_metadata,
-                        obj_label=obj_label,
-                        obj_id=obj_id,
-                    )
-                    d_obj.cells.append(cell)
-                    try:
-                        if int(obj_id) > max_id:
-                            max_id = int(obj_id)
-                    except ValueError:
-                        pass
-        d_obj._next_id = max_id + 1
-        parsed.append(d_obj)
 
+def _finish_import(name: str, parsed: list[Diagram]) -> str:
+    """Register the parsed pages and build the import summary."""
     if not parsed:
         return "Error: no valid diagram pages found."
     df_obj = DrawioFile(diagrams=parsed)
-    with _diagrams_lock:
-        _diagrams[name] = df_obj
+    _register_diagram(name, df_obj)
     total = sum(len(d_obj.cells) for d_obj in df_obj.diagrams)
     return f"Imported '{name}' with {len(df_obj.diagrams)} page(s) and {total} cells."
 
 
+# Attributes on <object>/<UserObject> wrappers that are not custom metadata.
+_KNOWN_OBJ_ATTRS = frozenset({"id", "label", "tooltip", "link", "placeholders"})
+
+
+def _parse_cell_element(
+    cell_el,
+    obj_tooltip: str = "",
+    obj_link: str = "",
+    obj_placeholders: bool = False,
+    obj_metadata: dict[str, str] | None = None,
+    obj_label: str = "",
+    obj_id: str = "",
+) -> MxCell:
+    """Parse an mxCell element into an MxCell, with optional <object> metadata."""
+    cid = obj_id or cell_el.get("id", "")
+    label = obj_label or cell_el.get("value", "")
+    geom_el = cell_el.find("mxGeometry")
+    geometry = None
+    if geom_el is not None:
+        # Bind each element's .get once — these attribute reads dominate
+        # the per-cell work on geometry-heavy imports.
+        get = geom_el.get
+        geometry = Geometry(
+            float(get("x", "0")),
+            float(get("y", "0")),
+            float(get("width", "0")),
+            float(get("height", "0")),
+            get("relative", "0") == "1",
+        )
+        # Waypoints, offset, source/target points, and alternate bounds all
+        # hang directly off the geometry element; dispatch on (tag, @as) in
+        # one pass over the children rather than a find() scan per feature.
+        for child in geom_el:
+            tag = child.tag
+            role = child.get("as")
+            get = child.get
+            if tag == "mxPoint":
+                if role == "offset":
+                    geometry.offset = Point(float(get("x", "0")), float(get("y", "0")))
+                elif role == "sourcePoint":
+                    geometry.source_point = Point(float(get("x", "0")), float(get("y", "0")))
+                elif role == "targetPoint":
+                    geometry.target_point = Point(float(get("x", "0")), float(get("y", "0")))
+            elif tag == "Array" and role == "points":
+                pts = geometry.points
+                for pt_el in child.findall("mxPoint"):
+                    get = pt_el.get
+                    pts.append(Point(float(get("x", "0")), float(get("y", "0"))))
+            elif tag == "mxGeometry" and role == "alternateBounds":
+                geometry.alternate_bounds = Geometry(
+                    float(get("x", "0")),
+                    float(get("y", "0")),
+                    float(get("width", "0")),
+                    float(get("height", "0")),
+                )
+
+    # Parse edge port constraints from style string.  Split the
+    # style once and look the four keys up in the map, instead
+    # of four regex scans per cell; most cells carry no port
+    # constraints, so a substring probe skips the split too.
+    cell_style = cell_el.get("style", "")
+    exit_x_val = exit_y_val = entry_x_val = entry_y_val = None
+    if "exit" in cell_style or "entry" in cell_style:
+        style_values = _style_value_map(cell_style)
+        exit_x_val = _style_float(style_values, "exitX")
+        exit_y_val = _style_float(style_values, "exitY")
+        entry_x_val = _style_float(style_values, "entryX")
+        entry_y_val = _style_float(style_values, "entryY")
+
+    return MxCell(
+        cid, label, cell_style,
+        parent=cell_el.get("parent", ""),
+        vertex=cell_el.get("vertex", "0") == "1",
+        edge=cell_el.get("edge", "0") == "1",
+        source=cell_el.get("source"),
+        target=cell_el.get("target"),
+        geometry=geometry,
+        exit_x=exit_x_val,
+        exit_y=exit_y_val,
+        entry_x=entry_x_val,
+        entry_y=entry_y_val,
+        tooltip=obj_tooltip or None,
+        link=obj_link or None,
+        placeholders=obj_placeholders,
+        metadata=obj_metadata or {},
+    )
+
+
+def _parse_diagram_element(diag_el) -> Diagram | None:
+    """Convert one <diagram> element into a Diagram, or None if empty."""
+    model_el = diag_el.find("mxGraphModel")
+    if model_el is None:
+        return None
+    d_obj = Diagram(
+        name=diag_el.get("name", "Page"),
+        id=diag_el.get("id", "imported"),
+        cells=[],
+    )
+    d_obj.grid = model_el.get("grid", "1") == "1"
+    d_obj.grid_size = int(model_el.get("gridSize", "10"))
+    d_obj.page_width = int(model_el.get("pageWidth", "827"))
+    d_obj.page_height = int(model_el.get("pageHeight", "1169"))
+    d_obj.background = model_el.get("background", "none")
+    d_obj.shadow = model_el.get("shadow", "0") == "1"
+    d_obj.math = model_el.get("math", "0") == "1"
+
+    root_el = model_el.find("root")
+    if root_el is None:
+        return None
+    max_id = 1
+    for child_el in root_el:
+        if child_el.tag == "mxCell":
+            cell = _parse_cell_element(child_el)
+            d_obj.cells.append(cell)
+            # Decimal check instead of try/int — raising ValueError per
+            # non-numeric id is far costlier than the probe. isdecimal,
+            # not isdigit: the latter accepts characters int() rejects.
+            if cell.id.isdecimal():
+                numeric_id = int(cell.id)
+                if numeric_id > max_id:
+                    max_id = numeric_id
+        elif child_el.tag == "object" or child_el.tag == "UserObject":
+            # <object> or <UserObject> wraps an <mxCell> with metadata
+            obj_id = child_el.get("id", "")
+            obj_label = child_el.get("label", "")
+            obj_tooltip = child_el.get("tooltip", "")
+            obj_link = child_el.get("link", "")
+            obj_placeholders = child_el.get("placeholders", "0") == "1"
+            # Collect custom metadata (all attributes except known ones)
+            obj_metadata = {
+                k: v for k, v in child_el.attrib.items()
+                if k not in _KNOWN_OBJ_ATTRS
+            }
+            inner_cell = child_el.find("mxCell")
+            if inner_cell is not None:
+                cell = _parse_cell_element(
+                    inner_cell,
+                    obj_tooltip=obj_tooltip,
+                    obj_link=obj_link,
+                    obj_placeholders=obj_placeholders,
+                    obj_metadata=obj_metadata,
+                    obj_label=obj_label,
+                    obj_id=obj_id,
+                )
+                d_obj.cells.append(cell)
+                if obj_id.isdecimal():
+                    numeric_id = int(obj_id)
+                    if numeric_id > max_id:
+                        max_id = numeric_id
+    d_obj._next_id = max_id + 1
+    # Cells were appended directly, bypassing the builder helpers.
+    d_obj.reindex_cells()
+    return d_obj
+
+
 def _get_all_bounds(d: Diagram) -> dict[str, CellBounds]:
     """Return bounding boxes for all vertex cells."""
     return get_all_vertex_bounds(d)
@@ -7,6 +7,7 @@ of pre-built shape / edge / container styles that match draw.io defaults.
 
 from __future__ import annotations
 
+import functools
 from dataclasses import dataclass, field
 from enum import Enum
 from typing import Optional
@@ -16,24 +17,52 @@ from typing import Optional
 # Style builder
 # ---------------------------------------------------------------------------
 
+@functools.lru_cache(maxsize=256)
+def _parse_style(raw: str) -> tuple[str, tuple[tuple[str, str], ...]]:
+    """Split a style string into (shape prefix, (key, value) pairs).
+
+    Cached: builders are overwhelmingly constructed from the constant
+    preset strings below, so each one is tokenized once and later
+    constructions pay a single dict build. The LRU cap keeps arbitrary
+    cell styles from growing the cache without bound.
+    """
+    prefix = ""
+    parts: list[tuple[str, str]] = []
+    for tok in raw.split(";"):
+        tok = tok.strip()
+        if not tok:
+            continue
+        k, sep, v = tok.partition("=")
+        if sep:
+            parts.append((k, v))
+        else:
+            # Shape name prefix like "ellipse", "rhombus", etc.
+            prefix = tok
+    return prefix, tuple(parts)
+
+
+# Indexable by a bool — avoids a branch in the on/off setters below.
+_BOOL = ("0", "1")
+
+# fontStyle is a 4-bit field (bold=1, italic=2, underline=4,
+# strikethrough=8); all 16 values as ready-made strings.
+_FONT_STYLE = tuple(str(i) for i in range(16))
+
+
 class StyleBuilder:
     """Fluent builder for semicolon-delimited draw.io style strings."""
 
+    __slots__ = ("_parts", "_prefix")
+
     def __init__(self, base: str = "") -> None:
-        self._parts: dict[str, str] = {}
-        self._prefix: str = ""
+        self._parts: dict[str, str]
+        self._prefix: str
         if base:
-            self._parse(base)
-
-    def _parse(self, raw: str) -> None:
-        tokens = [t.strip() for t in raw.split(";") if t.strip()]
-        for tok in tokens:
-            if "=" in tok:
-                k, v = tok.split("=", 1)
-                self._parts[k] = v
-            else:
-                # Shape name prefix like "ellipse", "rhombus", etc.
-                self._prefix = tok
+            self._prefix, items = _parse_style(base)
+            self._parts = dict(items)
+        else:
+            self._parts = {}
+            self._prefix = ""
 
     # -- appearance --
 
@@ -63,16 +92,8 @@ class StyleBuilder:
 
     def font_style(self, bold: bool = False, italic: bool = False,
                    underline: bool = False, strikethrough: bool = False) -> StyleBuilder:
-        val = 0
-        if bold:
-            val |= 1
-        if italic:
-            val |= 2
-        if underline:
-            val |= 4
-        if strikethrough:
-            val |= 8
-        self._parts["fontStyle"] = str(val)
+        self._parts["fontStyle"] = _FONT_STYLE[
+            bold | italic << 1 | underline << 2 | strikethrough << 3]
         return self
 
     def opacity(self, value: int) -> StyleBuilder:
@@ -84,19 +105,19 @@ class StyleBuilder:
         return self
 
     def shadow(self, on: bool = True) -> StyleBuilder:
-        self._parts["shadow"] = "1" if on else "0"
+        self._parts["shadow"] = _BOOL[on]
         return self
 
     def glass(self, on: bool = True) -> StyleBuilder:
-        self._parts["glass"] = "1" if on else "0"
+        self._parts["glass"] = _BOOL[on]
         return self
 
     def rounded(self, on: bool = True) -> StyleBuilder:
-        self._parts["rounded"] = "1" if on else "0"
+        self._parts["rounded"] = _BOOL[on]
         return self
 
     def dashed(self, on: bool = True, pattern: str = "") -> StyleBuilder:
-        self._parts["dashed"] = "1" if on else "0"
+        self._parts["dashed"] = _BOOL[on]
         if pattern:
             self._parts["dashPattern"] = pattern
         return self
@@ -168,7 +189,7 @@ class StyleBuilder:
         return self
 
     def curved(self, on: bool = True) -> StyleBuilder:
-        self._parts["curved"] = "1" if on else "0"
+        self._parts["curved"] = _BOOL[on]
         return self
 
     def end_arrow(self, arrow: str) -> StyleBuilder:
@@ -180,11 +201,11 @@ class StyleBuilder:
         return self
 
     def end_fill(self, on: bool = True) -> StyleBuilder:
-        self._parts["endFill"] = "1" if on else "0"
+        self._parts["endFill"] = _BOOL[on]
         return self
 
     def start_fill(self, on: bool = True) -> StyleBuilder:
-        self._parts["startFill"] = "1" if on else "0"
+        self._parts["startFill"] = _BOOL[on]
         return self
 
     def end_size(self, size: float) -> StyleBuilder:
@@ -214,11 +235,11 @@ class StyleBuilder:
     # -- container --
 
     def container(self, on: bool = True) -> StyleBuilder:
-        self._parts["container"] = "1" if on else "0"
+        self._parts["container"] = _BOOL[on]
         return self
 
     def collapsible(self, on: bool = True) -> StyleBuilder:
-        self._parts["collapsible"] = "1" if on else "0"
+        self._parts["collapsible"] = _BOOL[on]
         return self
 
     # -- arbitrary key --
@@ -230,12 +251,18 @@ class StyleBuilder:
     # -- build --
 
     def build(self) -> str:
-        parts: list[str] = []
+        # Append raw tokens and join once — no per-entry f-string objects.
+        out: list[str] = []
+        append = out.append
         if self._prefix:
-            parts.append(self._prefix)
+            append(self._prefix)
+            append(";")
         for k, v in self._parts.items():
-            parts.append(f"{k}={v}")
-        return ";".join(parts) + ";"
+            append(k)
+            append("=")
+            append(v)
+            append(";")
+        return "".join(out) if out else ";"
 
 
 # ---------------------------------------------------------------------------
@@ -701,6 +728,9 @@ class ColorTheme:
     font: str
     gradient: str = ""
 
+    def __str__(self) -> str:
+        return f"fill={self.fill} stroke={self.stroke} font={self.font}"
+
     def apply(self, builder: StyleBuilder) -> StyleBuilder:
         builder.fill_color(self.fill)
         builder.stroke_color(self.stroke)
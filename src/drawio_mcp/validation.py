@@ -43,6 +43,9 @@ def validate_string(value: Any, field_name: str, *, allow_empty: bool = True) ->
     return value
 
 
+_COLOR_PAT = re.compile(r"^#(?:[0-9a-fA-F]{3}|[0-9a-fA-F]{6}|[0-9a-fA-F]{8})$")
+
+
 def validate_color(value: Any, field_name: str, *, allow_none: bool = False) -> str:
     """Validate a CSS-style hex color (#RGB, #RRGGBB, #RRGGBBAA) or 'none'."""
     if allow_none and (value == "none" or value == ""):
@@ -52,7 +55,7 @@ def validate_color(value: Any, field_name: str, *, allow_none: bool = False) ->
     value = value.strip()
     if value == "none" or value == "":
         return value
-    if not re.match(r"^#(?:[0-9a-fA-F]{3}|[0-9a-fA-F]{6}|[0-9a-fA-F]{8})$", value):
+    if not _COLOR_PAT.match(value):
         raise ValidationError(
             f"'{field_name}' must be a valid hex color (#RGB, #RRGGBB, or #RRGGBBAA), got '{value}'."
         )
@@ -115,14 +118,18 @@ def validate_bool(value: Any, field_name: str) -> bool:
     return value
 
 
-def validate_enum(value: Any, field_name: str, allowed: set[str]) -> str:
-    """Validate that a string value is one of the allowed choices (case-insensitive)."""
+def validate_enum(value: Any, field_name: str, allowed: frozenset[str]) -> str:
+    """Validate that a string value is one of the allowed choices (case-insensitive).
+
+    *allowed* entries must already be uppercase — all module-level choice sets
+    are — so membership is a direct frozenset probe.
+    """
     if not isinstance(value, str):
         raise ValidationError(
             f"'{field_name}' must be a string, got {type(value).__name__}."
         )
     normalized = value.strip().upper()
-    if normalized not in {a.upper() for a in allowed}:
+    if normalized not in allowed:
         choices = ", ".join(sorted(allowed))
         raise ValidationError(
             f"'{field_name}' must be one of [{choices}], got '{value}'."
@@ -163,54 +170,77 @@ def validate_file_path(value: Any, field_name: str) -> str:
 # Composite / domain validators
 # ---------------------------------------------------------------------------
 
-_VALID_DIRECTIONS = {"TB", "BT", "LR", "RL"}
-_VALID_ALIGNMENTS = {"LEFT", "CENTER", "RIGHT", "TOP", "MIDDLE", "BOTTOM"}
-_VALID_DIST_DIRECTIONS = {"HORIZONTAL", "VERTICAL"}
+_VALID_DIRECTIONS = frozenset({"TB", "BT", "LR", "RL"})
+_VALID_ALIGNMENTS = frozenset({"LEFT", "CENTER", "RIGHT", "TOP", "MIDDLE", "BOTTOM"})
+_VALID_DIST_DIRECTIONS = frozenset({"HORIZONTAL", "VERTICAL"})
 
-_DIAGRAM_ACTIONS = {"CREATE", "SAVE", "LOAD", "IMPORT_XML", "LIST", "GET_XML", "ADD_PAGE", "ADD_LAYER"}
-_DRAW_ACTIONS = {
+_DIAGRAM_ACTIONS = frozenset({"CREATE", "SAVE", "LOAD", "IMPORT_XML", "LIST", "GET_XML", "ADD_PAGE", "ADD_LAYER"})
+_DRAW_ACTIONS = frozenset({
     "ADD_VERTICES", "ADD_EDGES", "ADD_GROUP", "UPDATE_CELLS",
     "DELETE_CELLS", "ADD_TITLE", "ADD_LEGEND", "BUILD_DAG", "BUILD_FULL",
-}
-_STYLE_ACTIONS = {
+})
+_STYLE_ACTIONS = frozenset({
     "BUILD", "APPLY_THEME", "LIST_VERTEX_PRESETS",
     "LIST_EDGE_PRESETS", "LIST_THEMES",
-}
-_LAYOUT_ACTIONS = {
+})
+_LAYOUT_ACTIONS = frozenset({
     "SUGIYAMA", "TREE", "HORIZONTAL", "VERTICAL", "GRID",
     "FLOWCHART", "SMART_CONNECT", "ALIGN", "DISTRIBUTE",
     "POLISH", "RELAYOUT", "COMPACT", "REROUTE_EDGES",
     "RESOLVE_OVERLAPS", "FIX_LABELS", "OPTIMIZE_CONNECTIONS",
     "RESIZE_CONTAINER",
-}
-_INSPECT_ACTIONS = {"CELLS", "OVERLAPS", "PORTS", "INFO"}
+})
+_INSPECT_ACTIONS = frozenset({"CELLS", "OVERLAPS", "PORTS", "INFO"})
 
-_PAGE_FORMATS = {
+_PAGE_FORMATS = frozenset({
     "A4_PORTRAIT", "A4_LANDSCAPE", "LETTER_PORTRAIT",
     "LETTER_LANDSCAPE", "A3_PORTRAIT", "A3_LANDSCAPE", "INFINITE",
-}
+})
 
-_FLOWCHART_TYPES = {
+_FLOWCHART_TYPES = frozenset({
     "PROCESS", "DECISION", "TERMINATOR", "DATA",
     "PREDEFINED", "MANUAL_INPUT", "PREPARATION",
     "DELAY", "DISPLAY", "STORED_DATA",
-}
+})
+
+
+# Canonicalization maps per allowed-set, built lazily: exact lowercase and
+# uppercase spellings hit a single dict probe on the happy path.
+_ACTION_CANON_MAPS: dict[frozenset[str], dict[str, str]] = {}
 
 
-def validate_action(value: Any, tool_name: str, allowed: set[str]) -> str:
+def _action_canon_map(allowed: frozenset[str]) -> dict[str, str]:
+    m = _ACTION_CANON_MAPS.get(allowed)
+    if m is None:
+        m = {}
+        for a in allowed:
+            lower = a.lower()
+            m[lower] = lower
+            m[a] = lower
+        _ACTION_CANON_MAPS[allowed] = m
+    return m
+
+
+def validate_action(value: Any, tool_name: str, allowed: frozenset[str]) -> str:
     """Validate the action parameter for a tool."""
-    if not isinstance(value, str) or not value.strip():
-        choices = ", ".join(sorted(a.lower() for a in allowed))
-        raise ValidationError(
-            f"'{tool_name}' requires an 'action' parameter. Valid actions: {choices}."
-        )
-    normalized = value.strip().upper()
-    if normalized not in allowed:
-        choices = ", ".join(sorted(a.lower() for a in allowed))
-        raise ValidationError(
-            f"Unknown {tool_name} action '{value}'. Valid actions: {choices}."
-        )
-    return value.strip().lower()
+    if isinstance(value, str):
+        canon_map = _action_canon_map(allowed)
+        canon = canon_map.get(value)
+        if canon is not None:
+            return canon
+        stripped = value.strip()
+        if stripped:
+            canon = canon_map.get(stripped.upper())
+            if canon is not None:
+                return canon
+            choices = ", ".join(sorted(a.lower() for a in allowed))
+            raise ValidationError(
+                f"Unknown {tool_name} action '{value}'. Valid actions: {choices}."
+            )
+    choices = ", ".join(sorted(a.lower() for a in allowed))
+    raise ValidationError(
+        f"'{tool_name}' requires an 'action' parameter. Valid actions: {choices}."
+    )
 
 
 def validate_page_index(value: Any, num_pages: int) -> int:
@@ -245,81 +275,83 @@ def validate_page_format(value: Any) -> str:
 # Vertex / edge / update dict validators
 # ---------------------------------------------------------------------------
 
+# Sentinel distinguishing "key absent" from "key present with a falsy or
+# None value" — lets the batch validators below probe each dict key once
+# with .get() instead of an `in` test followed by a subscript.
+_MISSING: Any = object()
+
+
 def validate_vertex_dict(v: dict, index: int) -> None:
     """Validate a single vertex dict from the vertices list."""
     if not isinstance(v, dict):
         raise ValidationError(f"Vertex at index {index} must be a dict/object.")
-    if "label" not in v:
+    label = v.get("label", _MISSING)
+    if label is _MISSING:
         raise ValidationError(f"Vertex at index {index} missing required key 'label'.")
-    if not isinstance(v["label"], str):
+    if not isinstance(label, str):
         raise ValidationError(f"Vertex at index {index}: 'label' must be a string.")
-    if "x" not in v:
+    x = v.get("x", _MISSING)
+    if x is _MISSING:
         raise ValidationError(f"Vertex at index {index} missing required key 'x'.")
-    if "y" not in v:
+    y = v.get("y", _MISSING)
+    if y is _MISSING:
         raise ValidationError(f"Vertex at index {index} missing required key 'y'.")
-    if not isinstance(v["x"], (int, float)):
+    if not isinstance(x, (int, float)):
         raise ValidationError(f"Vertex at index {index}: 'x' must be a number.")
-    if not isinstance(v["y"], (int, float)):
+    if not isinstance(y, (int, float)):
         raise ValidationError(f"Vertex at index {index}: 'y' must be a number.")
-    if "width" in v and not isinstance(v["width"], (int, float)):
-        raise ValidationError(f"Vertex at index {index}: 'width' must be a number.")
-    if "width" in v and v["width"] <= 0:
-        raise ValidationError(f"Vertex at index {index}: 'width' must be > 0.")
-    if "height" in v and not isinstance(v["height"], (int, float)):
-        raise ValidationError(f"Vertex at index {index}: 'height' must be a number.")
-    if "height" in v and v["height"] <= 0:
-        raise ValidationError(f"Vertex at index {index}: 'height' must be > 0.")
-    if "style_preset" in v and not isinstance(v["style_preset"], str):
-        raise ValidationError(f"Vertex at index {index}: 'style_preset' must be a string.")
-    if "custom_style" in v and not isinstance(v["custom_style"], str):
-        raise ValidationError(f"Vertex at index {index}: 'custom_style' must be a string.")
-    if "parent_id" in v and not isinstance(v["parent_id"], str):
-        raise ValidationError(f"Vertex at index {index}: 'parent_id' must be a string.")
-    if "cell_id" in v and not isinstance(v["cell_id"], str):
-        raise ValidationError(f"Vertex at index {index}: 'cell_id' must be a string.")
+    for key in ("width", "height"):
+        size = v.get(key, _MISSING)
+        if size is _MISSING:
+            continue
+        if not isinstance(size, (int, float)):
+            raise ValidationError(f"Vertex at index {index}: '{key}' must be a number.")
+        if size <= 0:
+            raise ValidationError(f"Vertex at index {index}: '{key}' must be > 0.")
+    for key in ("style_preset", "custom_style", "parent_id", "cell_id"):
+        val = v.get(key, _MISSING)
+        if val is not _MISSING and not isinstance(val, str):
+            raise ValidationError(f"Vertex at index {index}: '{key}' must be a string.")
 
 
 def validate_edge_dict(e: dict, index: int) -> None:
     """Validate a single edge dict from the edges list (add_edges / build_full)."""
     if not isinstance(e, dict):
         raise ValidationError(f"Edge at index {index} must be a dict/object.")
-    if "source_id" not in e:
+    source_id = e.get("source_id", _MISSING)
+    if source_id is _MISSING:
         raise ValidationError(f"Edge at index {index} missing required key 'source_id'.")
-    if "target_id" not in e:
+    target_id = e.get("target_id", _MISSING)
+    if target_id is _MISSING:
         raise ValidationError(f"Edge at index {index} missing required key 'target_id'.")
-    if not isinstance(e["source_id"], str) or not e["source_id"].strip():
+    if not isinstance(source_id, str) or not source_id.strip():
         raise ValidationError(f"Edge at index {index}: 'source_id' must be a non-empty string.")
-    if not isinstance(e["target_id"], str) or not e["target_id"].strip():
+    if not isinstance(target_id, str) or not target_id.strip():
         raise ValidationError(f"Edge at index {index}: 'target_id' must be a non-empty string.")
-    if e["source_id"] == e["target_id"]:
+    if source_id == target_id:
         raise ValidationError(f"Edge at index {index}: 'source_id' and 'target_id' must be different (self-loops not supported).")
-    if "label" in e and not isinstance(e["label"], str):
-        raise ValidationError(f"Edge at index {index}: 'label' must be a string.")
-    if "style_preset" in e and not isinstance(e["style_preset"], str):
-        raise ValidationError(f"Edge at index {index}: 'style_preset' must be a string.")
-    if "custom_style" in e and not isinstance(e["custom_style"], str):
-        raise ValidationError(f"Edge at index {index}: 'custom_style' must be a string.")
-    if "exit_port" in e and not isinstance(e["exit_port"], str):
-        raise ValidationError(f"Edge at index {index}: 'exit_port' must be a string.")
-    if "entry_port" in e and not isinstance(e["entry_port"], str):
-        raise ValidationError(f"Edge at index {index}: 'entry_port' must be a string.")
-    if "parent_id" in e and not isinstance(e["parent_id"], str):
-        raise ValidationError(f"Edge at index {index}: 'parent_id' must be a string.")
+    for key in ("label", "style_preset", "custom_style", "exit_port", "entry_port", "parent_id"):
+        val = e.get(key, _MISSING)
+        if val is not _MISSING and not isinstance(val, str):
+            raise ValidationError(f"Edge at index {index}: '{key}' must be a string.")
 
 
 def validate_dag_edge_dict(e: dict, index: int) -> None:
     """Validate a single edge dict for build_dag (uses labels, not IDs)."""
     if not isinstance(e, dict):
         raise ValidationError(f"Edge at index {index} must be a dict/object.")
-    if "source" not in e:
+    source = e.get("source", _MISSING)
+    if source is _MISSING:
         raise ValidationError(f"Edge at index {index} missing required key 'source'.")
-    if "target" not in e:
+    target = e.get("target", _MISSING)
+    if target is _MISSING:
         raise ValidationError(f"Edge at index {index} missing required key 'target'.")
-    if not isinstance(e["source"], str) or not e["source"].strip():
+    if not isinstance(source, str) or not source.strip():
         raise ValidationError(f"Edge at index {index}: 'source' must be a non-empty string.")
-    if not isinstance(e["target"], str) or not e["target"].strip():
+    if not isinstance(target, str) or not target.strip():
         raise ValidationError(f"Edge at index {index}: 'target' must be a non-empty string.")
-    if "label" in e and not isinstance(e["label"], str):
+    label = e.get("label", _MISSING)
+    if label is not _MISSING and not isinstance(label, str):
         raise ValidationError(f"Edge at index {index}: 'label' must be a string.")
 
 
@@ -327,26 +359,27 @@ def validate_update_dict(u: dict, index: int) -> None:
     """Validate a single update dict from the updates list."""
     if not isinstance(u, dict):
         raise ValidationError(f"Update at index {index} must be a dict/object.")
-    if "cell_id" not in u:
+    cell_id = u.get("cell_id", _MISSING)
+    if cell_id is _MISSING:
         raise ValidationError(f"Update at index {index} missing required key 'cell_id'.")
-    if not isinstance(u["cell_id"], str) or not u["cell_id"].strip():
+    if not isinstance(cell_id, str) or not cell_id.strip():
         raise ValidationError(f"Update at index {index}: 'cell_id' must be a non-empty string.")
-    if "label" in u and not isinstance(u["label"], str):
-        raise ValidationError(f"Update at index {index}: 'label' must be a string.")
-    if "style" in u and not isinstance(u["style"], str):
-        raise ValidationError(f"Update at index {index}: 'style' must be a string.")
-    if "x" in u and not isinstance(u["x"], (int, float)):
-        raise ValidationError(f"Update at index {index}: 'x' must be a number.")
-    if "y" in u and not isinstance(u["y"], (int, float)):
-        raise ValidationError(f"Update at index {index}: 'y' must be a number.")
-    if "width" in u and not isinstance(u["width"], (int, float)):
-        raise ValidationError(f"Update at index {index}: 'width' must be a number.")
-    if "width" in u and u["width"] <= 0:
-        raise ValidationError(f"Update at index {index}: 'width' must be > 0.")
-    if "height" in u and not isinstance(u["height"], (int, float)):
-        raise ValidationError(f"Update at index {index}: 'height' must be a number.")
-    if "height" in u and u["height"] <= 0:
-        raise ValidationError(f"Update at index {index}: 'height' must be > 0.")
+    for key in ("label", "style"):
+        val = u.get(key, _MISSING)
+        if val is not _MISSING and not isinstance(val, str):
+            raise ValidationError(f"Update at index {index}: '{key}' must be a string.")
+    for key in ("x", "y"):
+        val = u.get(key, _MISSING)
+        if val is not _MISSING and not isinstance(val, (int, float)):
+            raise ValidationError(f"Update at index {index}: '{key}' must be a number.")
+    for key in ("width", "height"):
+        size = u.get(key, _MISSING)
+        if size is _MISSING:
+            continue
+        if not isinstance(size, (int, float)):
+            raise ValidationError(f"Update at index {index}: '{key}' must be a number.")
+        if size <= 0:
+            raise ValidationError(f"Update at index {index}: '{key}' must be > 0.")
 
 
 def validate_legend_entry(entry: dict, index: int) -> None:
@@ -363,24 +396,34 @@ def validate_legend_entry(entry: dict, index: int) -> None:
         validate_color(entry["stroke_color"], f"legend_entries[{index}].stroke_color")
 
 
-def validate_connection_dict(c: dict, index: int) -> None:
-    """Validate a single connection dict for smart_connect / sugiyama."""
+def validate_connection_dict(c: dict, index: int) -> tuple[str, str, str]:
+    """Validate a single connection dict for smart_connect / sugiyama.
+
+    Returns the normalized (source, target, label) triple, preferring
+    the label keys over the id keys, so callers that need edge tuples
+    can collect them during validation instead of re-probing each dict.
+    """
     if not isinstance(c, dict):
         raise ValidationError(f"Connection at index {index} must be a dict/object.")
     # Accept both source/target (labels) and source_id/target_id (IDs)
-    has_label_keys = "source" in c and "target" in c
+    src = c.get("source", _MISSING)
+    tgt = c.get("target", _MISSING)
+    has_label_keys = src is not _MISSING and tgt is not _MISSING
     has_id_keys = "source_id" in c and "target_id" in c
     if not has_label_keys and not has_id_keys:
         raise ValidationError(
             f"Connection at index {index} must have either "
             "'source'+'target' or 'source_id'+'target_id'."
         )
-    if "label" in c and not isinstance(c["label"], str):
-        raise ValidationError(f"Connection at index {index}: 'label' must be a string.")
-    if "exit_port" in c and not isinstance(c["exit_port"], str):
-        raise ValidationError(f"Connection at index {index}: 'exit_port' must be a string.")
-    if "entry_port" in c and not isinstance(c["entry_port"], str):
-        raise ValidationError(f"Connection at index {index}: 'entry_port' must be a string.")
+    for key in ("label", "exit_port", "entry_port"):
+        val = c.get(key, _MISSING)
+        if val is not _MISSING and not isinstance(val, str):
+            raise ValidationError(f"Connection at index {index}: '{key}' must be a string.")
+    if src is _MISSING:
+        src = c.get("source_id", "")
+    if tgt is _MISSING:
+        tgt = c.get("target_id", "")
+    return src, tgt, c.get("label", "")
 
 
 def validate_flowchart_step(step: dict, index: int) -> None:
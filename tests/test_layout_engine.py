@@ -461,6 +461,25 @@ class TestServerIntegration:
         result = layout(action="polish", diagram_name="pol1")
         assert "polished" in result.lower()
 
+    def test_polish_cache_invalidated_by_label_edit(self) -> None:
+        from drawio_mcp.server import _diagrams, diagram, draw, layout
+
+        diagram(action="create", name="pol_cache")
+        ids = json.loads(draw(action="add_vertices", diagram_name="pol_cache", vertices=[
+            {"label": "A", "x": 40, "y": 40},
+            {"label": "B", "x": 240, "y": 40},
+        ]))
+        draw(action="add_edges", diagram_name="pol_cache", edges=[
+            {"source_id": ids[0], "target_id": ids[1], "label": "before"},
+        ])
+        layout(action="polish", diagram_name="pol_cache")
+        d = _diagrams["pol_cache"].active_diagram
+        cached = d._polish_hash
+        edge = next(c for c in d.cells if c.edge)
+        edge.value = "after"
+        layout(action="polish", diagram_name="pol_cache")
+        assert d._polish_hash != cached
+
     def test_fix_edge_labels_tool(self) -> None:
         from drawio_mcp.server import diagram, draw, layout
 
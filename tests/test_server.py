@@ -538,6 +538,17 @@ def test_add_legend() -> None:
     assert len(children) == 2
 
 
+def test_legend_items_are_indexed() -> None:
+    """Legend item cells must be findable through the diagram cell index."""
+    diagram(action="create", name="leg2")
+    lid = draw(action="add_legend", diagram_name="leg2", legend_entries=[
+        {"label": "Queue"},
+    ])
+    d = _diagrams["leg2"].active_diagram
+    item = next(c for c in d.cells if c.parent == lid)
+    assert d.find_cell(item.id) is item
+
+
 def test_default_edge_style_is_orthogonal() -> None:
     """Default edge style should now be orthogonal+rounded."""
     diagram(action="create", name="defedge")
@@ -992,6 +1003,28 @@ def test_import_xml_with_user_object() -> None:
     assert db["tooltip"] == "Primary DB"
 
 
+def test_import_xml_with_non_decimal_digit_id() -> None:
+    """Ids made of digit-like characters int() rejects must not crash import."""
+    xml_content = '''<?xml version="1.0" encoding="UTF-8"?>
+    <mxfile host="test">
+      <diagram name="test" id="t1">
+        <mxGraphModel>
+          <root>
+            <mxCell id="0"/>
+            <mxCell id="1" parent="0"/>
+            <mxCell id="²" value="Sup" style="rounded=1;" parent="1" vertex="1">
+              <mxGeometry as="geometry" x="10" y="10" width="120" height="60"/>
+            </mxCell>
+          </root>
+        </mxGraphModel>
+      </diagram>
+    </mxfile>'''
+    result = diagram(action="import_xml", name="sup_import", xml_content=xml_content)
+    assert "Imported" in result
+    cells = json.loads(inspect(action="cells", diagram_name="sup_import"))
+    assert any(c.get("label") == "Sup" for c in cells)
+
+
 # ===========================================================================
 # mxfile attributes
 # ===========================================================================